@@ -0,0 +1,121 @@
+import numpy as np
+import theano
+import theano.tensor as T
+
+from theano.gof import graph
+from theano.tensor.shared_randomstreams import RandomStateSharedVariable
+
+def random_states(variables):
+    """ Returns the random states of the ``RandomStreams`` the graph of ``variables`` draws from """
+    return [v for v in graph.inputs(variables) if isinstance(v, RandomStateSharedVariable)]
+
+class AdamOptimizer(object):
+
+    def __init__(self, params, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-08):
+        """
+        Adam over a single flat buffer holding all of ``params``, so that the
+        moment and parameter updates of a whole network are a few large
+        elementwise ops instead of several small ones per parameter.
+
+        Costs are moved onto the buffer with ``clone``, which replaces every
+        parameter by a reshaped slice of it. The shared variables of the
+        layers are left alone while training and only hold the trained values
+        again after ``sync``, which has to be called before saving or using
+        the network outside of the training functions.
+
+        :type params: list
+        :param params: shared variables of the network or parameter group
+
+        :type alpha: float
+        :param alpha: step size, already divided by the batch size where
+        the costs are summed rather than averaged
+        """
+
+        self.params = list(params)
+        self.alpha = alpha
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+
+        values = [p.get_value(borrow=True) for p in self.params]
+        self.shapes = [v.shape for v in values]
+        self.offsets = np.cumsum([0] + [v.size for v in values])
+
+        self.flat = theano.shared(np.concatenate([v.ravel() for v in values]).astype(theano.config.floatX), borrow=True)
+        self.m0 = theano.shared(np.zeros(self.offsets[-1], dtype=theano.config.floatX), borrow=True)
+        self.m1 = theano.shared(np.zeros(self.offsets[-1], dtype=theano.config.floatX), borrow=True)
+        self.t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.accumulator = None
+        self.accumulated = None
+
+        self.views = [self.flat[a:b].reshape(shape) for a, b, shape in
+                      zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+
+    @property
+    def replace(self):
+        """ The view of the buffer replacing every parameter """
+        return dict(zip(self.params, self.views))
+
+    def clone(self, outputs, *others):
+        """
+        Returns ``outputs`` with the parameters of this optimizer and of the
+        ``others`` replaced by their views. Graphs that depend on the
+        parameters of several optimizers have to be cloned with all of them,
+        or they would read parameters that are no longer updated.
+        """
+        replace = self.replace
+        for other in others: replace.update(other.replace)
+        return theano.clone(outputs, replace=replace)
+
+    def gradients(self, cost):
+        """ Returns the gradient of a cloned cost with respect to the whole buffer """
+        return T.grad(cost, self.flat)
+
+    def step(self, g):
+        """ Returns the updates of one Adam step along the flat gradient ``g`` """
+
+        m0 = self.beta1 * self.m0 + (1-self.beta1) *  g
+        m1 = self.beta2 * self.m1 + (1-self.beta2) * (g*g)
+        flat = self.flat - self.alpha * (
+            (m0/(1-(self.beta1**self.t[0]))) /
+            (T.sqrt(m1/(1-(self.beta2**self.t[0]))) + self.eps))
+
+        return [(self.flat, flat), (self.m0, m0), (self.m1, m1), (self.t, self.t+1)]
+
+    def updates(self, cost):
+        """ Returns the updates of one Adam step on a cost cloned with ``clone`` """
+        return self.step(self.gradients(cost))
+
+    def accumulate(self, cost):
+        """
+        Returns updates adding the gradient of a cloned cost to a flat
+        accumulator instead of taking a step, so that the gradients of
+        several micro-batches can be applied as one step with ``apply``
+        """
+        if self.accumulator is None:
+            self.accumulator = theano.shared(np.zeros(self.offsets[-1], dtype=theano.config.floatX), borrow=True)
+            self.accumulated = theano.shared(np.array(0, dtype=theano.config.floatX))
+        return [(self.accumulator, self.accumulator + self.gradients(cost)),
+                (self.accumulated, self.accumulated + 1)]
+
+    def apply(self):
+        """ Returns the updates of one Adam step along the mean accumulated gradient, emptying the accumulator """
+        return self.step(self.accumulator / T.maximum(self.accumulated, 1)) + [
+            (self.accumulator, T.zeros_like(self.accumulator)),
+            (self.accumulated, T.zeros_like(self.accumulated))]
+
+    def sync(self):
+        """ Writes the trained values back into the shared variables of the parameters """
+        flat = self.flat.get_value(borrow=True)
+        for p, a, b, shape in zip(self.params, self.offsets[:-1], self.offsets[1:], self.shapes):
+            p.set_value(flat[a:b].reshape(shape))
+
+    def get_state(self):
+        """ Returns copies of the parameters, moments and step counter """
+        return dict((name, getattr(self, name).get_value()) for name in ['flat', 'm0', 'm1', 't'])
+
+    def set_state(self, state):
+        """ Restores a state returned by ``get_state`` and writes the parameters back """
+        for name in ['flat', 'm0', 'm1', 't']:
+            getattr(self, name).set_value(state[name])
+        self.sync()
@@ -2,89 +2,126 @@ import sys
 import numpy as np
 import theano
 import theano.tensor as T
-from theano.tensor.shared_randomstreams import RandomStreams
 from datetime import datetime
 
-class AdamTrainer:
+from nn.BaseAdamTrainer import BaseAdamTrainer
+from nn.FunctionCache import cached_function
+
+def one_hot(y, output):
+    """
+    Expands a vector of integer class indices to one-hot rows as wide as
+    ``output``, inside the graph. Rows of the unlabelled index -1 are all
+    zero. Labels that are not integer indices are returned unchanged.
+    """
+    if y.ndim != 1 or 'int' not in y.dtype: return y
+    return T.eq(y.dimshuffle(0, 'x'), T.arange(output.shape[1])).astype(output.dtype)
+
+def cross_entropy(output, y):
+    """ Binary cross entropy of one-hot labels or of integer class indices """
+    return T.nnet.binary_crossentropy(output, one_hot(y, output)).mean()
+
+def sparse_cross_entropy(output, y):
+    """ Categorical cross entropy of integer class indices, averaged over the labelled rows """
+    labelled = T.neq(y, -1)
+    costs = T.nnet.categorical_crossentropy(output, T.maximum(y, 0))
+    return T.sum(costs * labelled) / T.maximum(T.sum(labelled), 1)
+
+class AdamTrainer(BaseAdamTrainer):
     
-    def __init__(self, rng, batchsize, epochs=100, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-08, gamma=0.1, cost='mse'):
-        self.alpha = alpha
-        self.beta1 = beta1
-        self.beta2 = beta2
-        self.eps = eps
-        self.gamma = gamma
-        self.rng = rng
-        self.theano_rng = RandomStreams(rng.randint(2 ** 30))
-        self.epochs = epochs
-        self.batchsize = batchsize
+    def __init__(self, rng, batchsize, epochs=100, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-08, gamma=0.1, cost='mse', checkpointer=None, accumulate=1):
+        BaseAdamTrainer.__init__(self, rng, batchsize, epochs, alpha, beta1, beta2, eps, gamma, checkpointer, accumulate)
         if   cost == 'mse':
             self.cost = lambda network, x, y: T.mean((network(x) - y)**2)
         elif cost == 'cross_entropy':
-            self.cost = lambda network, x, y: T.nnet.binary_crossentropy(network(x), y).mean()
+            self.cost = lambda network, x, y: cross_entropy(network(x), y)
+        elif cost == 'sparse_cross_entropy':
+            self.cost = lambda network, x, y: sparse_cross_entropy(network(x), y)
+        elif cost == 'masked_mse':
+            self.cost = lambda network, x, mask: (T.sum(mask.dimshuffle(0, 'x', 1) * (network(x) - x)**2) /
+                                                  (T.sum(mask) * x.shape[1]))
         else:
             self.cost = cost
         
-    def regularization(self, network, target=0.0):
-        return sum([T.mean(abs(p - target)) for p in network.params]) / len(network.params)
-        
     def get_cost_updates(self, network, input, output):
         
         cost = (self.cost(network, input, output) + self.gamma * self.regularization(network))
         
-        gparams = T.grad(cost, self.params)
-        m0params = [self.beta1 * m0p + (1-self.beta1) *  gp     for m0p, gp in zip(self.m0params, gparams)]
-        m1params = [self.beta2 * m1p + (1-self.beta2) * (gp*gp) for m1p, gp in zip(self.m1params, gparams)]
-        params = [p - (self.alpha / self.batchsize) * 
-                  ((m0p/(1-(self.beta1**self.t[0]))) /
-            (T.sqrt(m1p/(1-(self.beta2**self.t[0]))) + self.eps))
-            for p, m0p, m1p in zip(self.params, m0params, m1params)]
+        return self.cost_updates(cost)
         
-        updates = ([( p,  pn) for  p,  pn in zip(self.params, params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.m0params, m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.m1params, m1params)] +
-                   [(self.t, self.t+1)])
+    def train_batches(self, network, batches, filename=None, prefetch=4, workers=1, fixed_shapes=False):
+        """ Trains on (input, output) batches prepared in the background, see ``BaseAdamTrainer.fit_batches`` """
+        return self.fit_batches([network], batches, filename, prefetch, workers, fixed_shapes)
+        
+    def train_pyramid(self, network, pyramid, epochs, filename=None):
+        """
+        Coarse-to-fine training of an autoencoding network on a temporal
+        pyramid (see ``tools/pyramid.py``), starting at the coarsest level and
+        ending at the full frame rate. The optimiser state carries over from
+        level to level.
+
+        :type pyramid: list
+        :param pyramid: the clips at every level, full frame rate first
+
+        :type epochs: list
+        :param epochs: number of epochs at every level, full frame rate first,
+        e.g. ``[50, 25, 25]`` trains 25 epochs at a quarter of the frame rate,
+        25 at half of it and 50 at the full rate
 
-        return (cost, updates)
+        The network has to accept clips of every level, which networks of
+        ``Conv1DLayer`` and ``Pool1DLayer`` do when the number of frames of the
+        coarsest level is still divisible by all pooling.
+        """
+        
+        self.init_params(network.params)
+        
+        functions = {}
+        last_mean = 0
+        for level in reversed(range(len(pyramid))):
+            
+            X = pyramid[level]
+            for epoch in range(epochs[level]):
+                
+                batchinds = np.arange(len(X) // self.batchsize)
+                self.rng.shuffle(batchinds)
+                
+                sys.stdout.write('\n')
+                
+                c = []
+                for bii, bi in enumerate(batchinds):
+                    batch = np.asarray(X[bi*self.batchsize:(bi+1)*self.batchsize])
+                    if level not in functions: functions[level] = self.batch_function([network], (batch, batch))
+                    c.append(functions[level](batch, batch))
+                    if np.isnan(c[-1]): return self.optimizer.sync()
+                    self.apply_gradients(bii + 1)
+                    if bii % (int(len(batchinds) / 1000) + 1) == 0:
+                        sys.stdout.write('\r[Level %i Epoch %i]  %0.1f%% mean %.5f' % (level, epoch, 100 * float(bii)/len(batchinds), np.mean(c)))
+                        sys.stdout.flush()
+                
+                self.apply_gradients(len(c), last=True)
+                curr_mean = np.mean(c)
+                diff_mean, last_mean = curr_mean-last_mean, curr_mean
+                sys.stdout.write('\r[Level %i Epoch %i] 100.0%% mean %.5f diff %.5f %s' % 
+                    (level, epoch, curr_mean, diff_mean, str(datetime.now())[11:19]))
+                sys.stdout.flush()
+                
+                # Costs of coarser levels are not comparable with the full frame rate
+                self.optimizer.sync()
+                self.checkpointer(network, filename, epoch, curr_mean if level == 0 else None)
+        
+        self.checkpointer.close(network, filename)
         
-    def train(self, network, input_data, output_data, filename=None):
+    def train(self, network, input_data, output_data, filename=None, state=None):
         
         input = input_data.type()
         output = output_data.type()
         index = T.lscalar()
         
-        self.params = network.params
-        self.m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.params]
-        self.m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.params]
-        self.t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.init_params(network.params)
         
         cost, updates = self.get_cost_updates(network, input, output)
-        train_func = theano.function([index], cost, updates=updates, givens={
+        train_func = cached_function([index], cost, updates=updates, givens={
             input:input_data[index*self.batchsize:(index+1)*self.batchsize],
             output:output_data[index*self.batchsize:(index+1)*self.batchsize],
         }, allow_input_downcast=True)
-        
-        last_mean = 0
-        for epoch in range(self.epochs):
-            
-            batchinds = np.arange(input_data.shape.eval()[0] // self.batchsize)
-            self.rng.shuffle(batchinds)
-            
-            sys.stdout.write('\n')
-            
-            c = []
-            for bii, bi in enumerate(batchinds):
-                c.append(train_func(bi))
-                if np.isnan(c[-1]): return
-                if bii % (int(len(batchinds) / 1000) + 1) == 0:
-                    sys.stdout.write('\r[Epoch %i]  %0.1f%% mean %.5f' % (epoch, 100 * float(bii)/len(batchinds), np.mean(c)))
-                    sys.stdout.flush()
-
-            curr_mean = np.mean(c)
-            diff_mean, last_mean = curr_mean-last_mean, curr_mean
-            sys.stdout.write('\r[Epoch %i] 100.0%% mean %.5f diff %.5f %s' % 
-                (epoch, curr_mean, diff_mean, str(datetime.now())[11:19]))
-            sys.stdout.flush()
-            
-            network.save(filename)
-                    
-                    
\ No newline at end of file
+        return self.fit(network, train_func, [cost] + [u for _, u in updates],
+            input_data.get_value(borrow=True).shape[0] // self.batchsize, filename, state)
@@ -10,6 +10,8 @@ from datetime import datetime
 from matplotlib import animation
 from mpl_toolkits.mplot3d import Axes3D
 from theano.tensor.shared_randomstreams import RandomStreams
+from nn.AdamOptimizer import AdamOptimizer
+from nn.FunctionCache import cached_function
 from nn.AnimationPlotLines import animation_plot
 
 class AdversarialAdamTrainer(object):
@@ -65,46 +67,26 @@ class AdversarialAdamTrainer(object):
         disc_fake_result = T.nnet.sigmoid(disc_result[:self.batchsize])
         disc_real_result = T.nnet.sigmoid(disc_result[self.batchsize:])   
 
-        # generator update
+        # generator cost
         gen_cost = self.generator_cost(disc_fake_result)
 
-        gen_param_values = [p.value for p in self.gen_params]
-        gen_gparams = T.grad(gen_cost, gen_param_values)
-
-        gen_m0params = [self.gen_beta1 * m0p + (1-self.gen_beta1) *  gp     for m0p, gp in zip(self.gen_m0params, gen_gparams)]
-        gen_m1params = [self.gen_beta2 * m1p + (1-self.gen_beta2) * (gp*gp) for m1p, gp in zip(self.gen_m1params, gen_gparams)]
-
-        gen_params = [p - self.gen_alpha * 
-                  ((m0p/(1-(self.gen_beta1**self.gen_t[0]))) /
-            (T.sqrt(m1p/(1-(self.gen_beta2**self.gen_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(gen_param_values, gen_m0params, gen_m1params)]
-
-        updates = ([( p,  pn) for  p,  pn in zip(gen_param_values, gen_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.gen_m0params, gen_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.gen_m1params, gen_m1params)] +
-                   [(self.gen_t, self.gen_t+1)])
-
-        # discriminator update
+        # discriminator cost
         disc_cost = self.discriminator_cost(disc_fake_result, disc_real_result)
 
-        disc_param_values = [p.value for p in self.disc_params]
-        disc_gparams = T.grad(disc_cost, disc_param_values)
-
-        disc_m0params = [self.disc_beta1 * m0p + (1-self.disc_beta1) *  gp     for m0p, gp in zip(self.disc_m0params, disc_gparams)]
-        disc_m1params = [self.disc_beta2 * m1p + (1-self.disc_beta2) * (gp*gp) for m1p, gp in zip(self.disc_m1params, disc_gparams)]
+        # Every cost depends on the parameters of all networks
+        gen_cost, disc_cost = self.gen_optimizer.clone(
+            [gen_cost, disc_cost], self.disc_optimizer)
 
-        disc_params = [p - self.disc_alpha * 
-                  ((m0p/(1-(self.disc_beta1**self.disc_t[0]))) /
-            (T.sqrt(m1p/(1-(self.disc_beta2**self.disc_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(disc_param_values, disc_m0params, disc_m1params)]
-
-        updates += ([( p,  pn) for  p,  pn in zip(disc_param_values, disc_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.disc_m0params, disc_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.disc_m1params, disc_m1params)] +
-                   [(self.disc_t, self.disc_t+1)])
+        updates = (self.gen_optimizer.updates(gen_cost) +
+                   self.disc_optimizer.updates(disc_cost))
 
         return (gen_cost, disc_cost, updates)
 
+    def sync(self):
+        """ Writes the trained values back into the parameters of all networks """
+        for optimizer in [self.gen_optimizer, self.disc_optimizer]:
+            optimizer.sync()
+
     def train(self, gen_network, disc_network, train_input, filename=None):
 
         """ Conventions: For training examples with labels, pass a one-hot vector, otherwise a numpy array with zero values.
@@ -120,22 +102,14 @@ class AdversarialAdamTrainer(object):
         rand_input = T.matrix()
         
         self.gen_params = gen_network.params
-        gen_param_values = [p.value for p in self.gen_params]
-
-        self.gen_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in gen_param_values]
-        self.gen_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in gen_param_values]
-        self.gen_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.gen_optimizer = AdamOptimizer(self.gen_params, self.gen_alpha, self.gen_beta1, self.gen_beta2, self.eps)
 
         self.disc_params = disc_network.params
-        disc_param_values = [p.value for p in self.disc_params]
-
-        self.disc_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in disc_param_values]
-        self.disc_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in disc_param_values]
-        self.disc_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.disc_optimizer = AdamOptimizer(self.disc_params, self.disc_alpha, self.disc_beta1, self.disc_beta2, self.eps)
 
         gen_cost, disc_cost, updates = self.get_cost_updates(gen_network, disc_network, input, rand_input)
 
-        train_func = theano.function(inputs=[index, rand_input], 
+        train_func = cached_function(inputs=[index, rand_input], 
                                      outputs=[gen_cost, disc_cost], 
                                      updates=updates, 
                                      givens={input:train_input[index*self.batchsize:(index+1)*self.batchsize],}, 
@@ -156,7 +130,7 @@ class AdversarialAdamTrainer(object):
 
         for epoch in range(self.epochs):
             
-            train_batchinds = np.arange(train_input.shape.eval()[0] // self.batchsize)
+            train_batchinds = np.arange(train_input.get_value(borrow=True).shape[0] // self.batchsize)
             self.rng.shuffle(train_batchinds)
 
             sys.stdout.write('\n')
@@ -174,16 +148,19 @@ class AdversarialAdamTrainer(object):
                 tr_gen_costs.append(np.absolute(1-tr_gen_cost))
                 if np.isnan(tr_gen_costs[-1]):
                     print "NaN in generator cost."
+                    self.sync()
                     return
 
                 tr_disc_costs.append(np.absolute(0.5-tr_disc_cost))
                 if np.isnan(tr_disc_costs[-1]):
                     print "NaN in discriminator cost."
+                    self.sync()
                     return
 
                 tr_gen_costs.append(tr_gen_cost)
                 tr_disc_costs.append(tr_disc_cost)
 
+            self.sync()
             gen_network.save(filename)
 
             gen_cost_mean.append(np.mean(tr_gen_costs))
@@ -10,6 +10,8 @@ from datetime import datetime
 from matplotlib import animation
 from mpl_toolkits.mplot3d import Axes3D
 from theano.tensor.shared_randomstreams import RandomStreams
+from nn.AdamOptimizer import AdamOptimizer
+from nn.FunctionCache import cached_function
 
 class AdversarialAdamTrainer(object):
     def __init__(self, rng, batchsize, 
@@ -75,65 +77,30 @@ class AdversarialAdamTrainer(object):
         disc_fake_result = self.discriminator(disc_network, dec_fake_result)
         disc_real_result = self.discriminator(disc_network, input)
 
-        # encoder update
+        # encoder cost
         enc_cost, vari_cost, repr_cost = self.encoder_cost(enc_result, dec_sample_result, input)
 
-        enc_param_values = [p.value for p in self.enc_params]
-        enc_gparams = T.grad(enc_cost, enc_param_values)
-
-        enc_m0params = [self.enc_beta1 * m0p + (1-self.enc_beta1) *  gp     for m0p, gp in zip(self.enc_m0params, enc_gparams)]
-        enc_m1params = [self.enc_beta2 * m1p + (1-self.enc_beta2) * (gp*gp) for m1p, gp in zip(self.enc_m1params, enc_gparams)]
-
-        enc_params = [p - self.enc_alpha * 
-                  ((m0p/(1-(self.enc_beta1**self.enc_t[0]))) /
-            (T.sqrt(m1p/(1-(self.enc_beta2**self.enc_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(enc_param_values, enc_m0params, enc_m1params)]
-
-        updates = ([( p,  pn) for  p,  pn in zip(enc_param_values, enc_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.enc_m0params, enc_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.enc_m1params, enc_m1params)] +
-                   [(self.enc_t, self.enc_t+1)])
-
-        # decoder update
+        # decoder cost
         dec_cost = self.decoder_cost(dec_sample_result, disc_sample_result, disc_fake_result, disc_real_result, input)
 
-        dec_param_values = [p.value for p in self.dec_params]
-        dec_gparams = T.grad(dec_cost, dec_param_values)
-
-        dec_m0params = [self.dec_beta1 * m0p + (1-self.dec_beta1) *  gp     for m0p, gp in zip(self.dec_m0params, dec_gparams)]
-        dec_m1params = [self.dec_beta2 * m1p + (1-self.dec_beta2) * (gp*gp) for m1p, gp in zip(self.dec_m1params, dec_gparams)]
-
-        dec_params = [p - self.dec_alpha * 
-                  ((m0p/(1-(self.dec_beta1**self.dec_t[0]))) /
-            (T.sqrt(m1p/(1-(self.dec_beta2**self.dec_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(dec_param_values, dec_m0params, dec_m1params)]
-
-        updates += ([( p,  pn) for  p,  pn in zip(dec_param_values, dec_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.dec_m0params, dec_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.dec_m1params, dec_m1params)] +
-                   [(self.dec_t, self.dec_t+1)])
-
-        # discriminator update
+        # discriminator cost
         disc_cost = self.discriminator_cost(disc_sample_result, disc_fake_result, disc_real_result)
 
-        disc_param_values = [p.value for p in self.disc_params]
-        disc_gparams = T.grad(disc_cost, disc_param_values)
-
-        disc_m0params = [self.disc_beta1 * m0p + (1-self.disc_beta1) *  gp     for m0p, gp in zip(self.disc_m0params, disc_gparams)]
-        disc_m1params = [self.disc_beta2 * m1p + (1-self.disc_beta2) * (gp*gp) for m1p, gp in zip(self.disc_m1params, disc_gparams)]
+        # Every cost depends on the parameters of all networks
+        enc_cost, dec_cost, disc_cost, vari_cost, repr_cost = self.enc_optimizer.clone(
+            [enc_cost, dec_cost, disc_cost, vari_cost, repr_cost], self.dec_optimizer, self.disc_optimizer)
 
-        disc_params = [p - self.disc_alpha * 
-                  ((m0p/(1-(self.disc_beta1**self.disc_t[0]))) /
-            (T.sqrt(m1p/(1-(self.disc_beta2**self.disc_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(disc_param_values, disc_m0params, disc_m1params)]
-
-        updates += ([( p,  pn) for  p,  pn in zip(disc_param_values, disc_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.disc_m0params, disc_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.disc_m1params, disc_m1params)] +
-                   [(self.disc_t, self.disc_t+1)])
+        updates = (self.enc_optimizer.updates(enc_cost) +
+                   self.dec_optimizer.updates(dec_cost) +
+                   self.disc_optimizer.updates(disc_cost))
 
         return (enc_cost, dec_cost, disc_cost, vari_cost, repr_cost, updates)
 
+    def sync(self):
+        """ Writes the trained values back into the parameters of all networks """
+        for optimizer in [self.enc_optimizer, self.dec_optimizer, self.disc_optimizer]:
+            optimizer.sync()
+
     def train(self, enc_network, dec_network, disc_network, var_network, train_input, filename=None):
 
         """ Conventions: For training examples with labels, pass a one-hot vector, otherwise a numpy array with zero values.
@@ -152,29 +119,17 @@ class AdversarialAdamTrainer(object):
         rand_input = T.matrix()
         
         self.enc_params = enc_network.params
-        enc_param_values = [p.value for p in self.enc_params]
-
-        self.enc_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in enc_param_values]
-        self.enc_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in enc_param_values]
-        self.enc_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.enc_optimizer = AdamOptimizer(self.enc_params, self.enc_alpha, self.enc_beta1, self.enc_beta2, self.eps)
 
         self.dec_params = dec_network.params
-        dec_param_values = [p.value for p in self.dec_params]
-
-        self.dec_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in dec_param_values]
-        self.dec_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in dec_param_values]
-        self.dec_t = theano.shared(np.array([1], dtype=theano.config.floatX))        
+        self.dec_optimizer = AdamOptimizer(self.dec_params, self.dec_alpha, self.dec_beta1, self.dec_beta2, self.eps)
 
         self.disc_params = disc_network.params
-        disc_param_values = [p.value for p in self.disc_params]
-
-        self.disc_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in disc_param_values]
-        self.disc_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in disc_param_values]
-        self.disc_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.disc_optimizer = AdamOptimizer(self.disc_params, self.disc_alpha, self.disc_beta1, self.disc_beta2, self.eps)
 
         enc_cost, dec_cost, disc_cost, vari_cost, repr_cost, updates = self.get_cost_updates(enc_network, dec_network, disc_network, var_network, input, rand_input)
 
-        train_func = theano.function(inputs=[index, rand_input], 
+        train_func = cached_function(inputs=[index, rand_input], 
                                      outputs=[enc_cost, dec_cost, disc_cost, vari_cost, repr_cost], 
                                      updates=updates, 
                                      givens={input:train_input[index*self.batchsize:(index+1)*self.batchsize],}, 
@@ -198,7 +153,7 @@ class AdversarialAdamTrainer(object):
 
         for epoch in range(self.epochs):
             
-            train_batchinds = np.arange(train_input.shape.eval()[0] // self.batchsize)
+            train_batchinds = np.arange(train_input.get_value(borrow=True).shape[0] // self.batchsize)
             self.rng.shuffle(train_batchinds)
 
             sys.stdout.write('\n')
@@ -222,16 +177,19 @@ class AdversarialAdamTrainer(object):
                 tr_enc_costs.append(tr_enc_cost)
                 if np.isnan(tr_enc_costs[-1]):
                     print "NaN in encoder cost."
+                    self.sync()
                     return
 
                 tr_dec_costs.append(tr_dec_cost)
                 if np.isnan(tr_dec_costs[-1]):
                     print "NaN in decoder cost."
+                    self.sync()
                     return                    
 
                 tr_disc_costs.append(np.absolute(2-tr_disc_cost))
                 if np.isnan(tr_disc_costs[-1]):
                     print "NaN in discriminator cost."
+                    self.sync()
                     return
 
                 tr_vari_costs.append(tr_vari_cost)
@@ -243,6 +201,7 @@ class AdversarialAdamTrainer(object):
             vari_cost_mean.append(np.mean(tr_vari_costs))
             repr_cost_mean.append(np.mean(tr_repr_costs))
 
+            self.sync()
             dec_network.save(filename)
 
         repr_plot, = plt.plot(repr_cost_mean, label='Repr. Error')
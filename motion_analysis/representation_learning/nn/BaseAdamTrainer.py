@@ -0,0 +1,225 @@
+import sys
+import numpy as np
+import theano
+import theano.tensor as T
+from theano.tensor.shared_randomstreams import RandomStreams
+from datetime import datetime
+
+from nn.AdamOptimizer import AdamOptimizer, random_states
+from nn.BatchPrefetcher import BatchPrefetcher
+from nn.Checkpointer import Checkpointer, read_state
+from nn.FunctionCache import cached_function
+
+class BaseAdamTrainer(object):
+
+    def __init__(self, rng, batchsize, epochs=100, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-08, gamma=0.1, checkpointer=None, accumulate=1):
+        """
+        The training loops shared by the Adam trainers: the optimiser, resuming
+        from a training state, gradient accumulation, prefetched batches and
+        checkpointing. A trainer only builds its cost in ``get_cost_updates``,
+        which returns ``cost_updates`` of it, and the training function of
+        ``train``, which it hands to ``fit``. ``train_batches`` hands its
+        networks to ``fit_batches``.
+
+        :type accumulate: int
+        :param accumulate: number of batches whose gradients are averaged
+        into one Adam step
+        """
+        self.alpha = alpha
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+        self.gamma = gamma
+        self.rng = rng
+        self.theano_rng = RandomStreams(rng.randint(2 ** 30))
+        self.epochs = epochs
+        self.batchsize = batchsize
+        self.checkpointer = Checkpointer() if checkpointer is None else checkpointer
+        self.accumulate = accumulate
+
+    def regularization(self, network, target=0.0):
+        return sum([T.mean(abs(p - target)) for p in network.params]) / len(network.params)
+
+    def init_params(self, params):
+        self.params = params
+        self.optimizer = AdamOptimizer(params, self.alpha / self.batchsize, self.beta1, self.beta2, self.eps)
+        self.apply_func = None
+
+    def cost_updates(self, cost):
+        """
+        Returns ``cost`` moved onto the buffer of the optimiser and its
+        updates: an Adam step, or with ``accumulate`` adding the gradient to
+        those of the other batches of the step
+        """
+        cost = self.optimizer.clone(cost)
+        if self.accumulate > 1: return (cost, self.optimizer.accumulate(cost))
+        return (cost, self.optimizer.updates(cost))
+
+    def apply_gradients(self, n_batches, last=False):
+        """
+        With gradient accumulation, takes the Adam step along the gradients of
+        the last ``accumulate`` batches once ``n_batches`` batches of the
+        epoch are done, or with ``last`` along those of any batches left over
+        at the end of the epoch
+        """
+        if self.accumulate == 1 or (n_batches % self.accumulate != 0) != last: return
+        if self.apply_func is None: self.apply_func = cached_function([], [], updates=self.optimizer.apply())
+        self.apply_func()
+
+    def training_state(self, filename, epoch, batch=0, order=None, costs=(), last_mean=0):
+        """
+        Returns ``(filename, state)`` with the complete state of training, to
+        be written with a checkpoint, or None if ``filename`` is None. The
+        position is the batch ``batch`` of the batch ``order`` of ``epoch``.
+        """
+        if filename is None: return None
+        return (filename, {
+            'optimizer': self.optimizer.get_state(),
+            'rng': self.rng.get_state(),
+            'random_states': [r.get_value() for r in self.random_states],
+            'best_score': self.checkpointer.best_score,
+            'position': dict(epoch=epoch, batch=batch, order=order, costs=list(costs), last_mean=last_mean)})
+
+    def restore(self, filename):
+        """ Restores the training state written to ``filename``, if any, and returns the position to resume from """
+        state = read_state(filename)
+        if state is None: return dict(epoch=0, batch=0, order=None, costs=[], last_mean=0)
+        self.optimizer.set_state(state['optimizer'])
+        self.rng.set_state(state['rng'])
+        for r, value in zip(self.random_states, state['random_states']): r.set_value(value)
+        self.checkpointer.best_score = state['best_score']
+        sys.stdout.write('... resuming at epoch %i batch %i\n' % (state['position']['epoch'], state['position']['batch']))
+        return state['position']
+
+    def batch_function(self, networks, batch, fixed_shape=False):
+        """
+        Compiles a training function taking the arrays of ``batch`` as inputs,
+        specialised to their exact shapes if ``fixed_shape``
+        """
+        inputs = [T.TensorType(b.dtype.name if np.issubdtype(b.dtype, np.integer) else theano.config.floatX,
+                               (False,) * np.ndim(b))() for b in batch]
+        shaped = [T.specify_shape(i, np.shape(b)) for i, b in zip(inputs, batch)] if fixed_shape else inputs
+        cost, updates = self.get_cost_updates(*(list(networks) + shaped))
+        return cached_function(inputs, cost, updates=updates, allow_input_downcast=True)
+
+    def fit_batches(self, networks, batches, filename=None, prefetch=4, workers=1, fixed_shapes=False):
+        """
+        Trains on minibatches prepared by background threads instead of
+        slicing a dataset held in shared variables.
+
+        :type networks: list
+        :param networks: the networks ``get_cost_updates`` takes before the
+        arrays of a batch, the first of which is trained and saved
+
+        :type batches: iterable or dataset object
+        :param batches: an iterable of batches, tuples of the arrays
+        ``get_cost_updates`` takes after the networks, iterated once per
+        epoch, or an object with ``__len__`` and ``__getitem__`` returning
+        batch ``i``, read in a new random order every epoch (see
+        ``BatchPrefetcher``). The ``shuffle`` method of a dataset object, such
+        as those of ``BucketSampler`` and ``WindowDataset``, is called before
+        every epoch to draw new batches.
+
+        :type prefetch: int
+        :param prefetch: number of batches every worker prepares ahead
+
+        :type workers: int
+        :param workers: number of threads reading a dataset object
+
+        :type fixed_shapes: bool
+        :param fixed_shapes: compile one training function per batch shape,
+        cached and reused whenever a batch of that shape comes again, e.g. for
+        the length buckets of ``BucketSampler``
+        """
+
+        self.init_params(networks[0].params)
+
+        functions = {}
+        last_mean = 0
+        for epoch in range(self.epochs):
+
+            if hasattr(batches, 'shuffle'): batches.shuffle()
+
+            order = None
+            if hasattr(batches, '__getitem__') and hasattr(batches, '__len__'):
+                order = np.arange(len(batches))
+                self.rng.shuffle(order)
+
+            sys.stdout.write('\n')
+
+            c = []
+            for bii, batch in enumerate(BatchPrefetcher(batches, order, prefetch, workers)):
+                key = tuple(np.shape(b) for b in batch) if fixed_shapes else None
+                if key not in functions: functions[key] = self.batch_function(networks, batch, fixed_shapes)
+                c.append(functions[key](*batch))
+                if np.isnan(c[-1]): return self.optimizer.sync()
+                self.apply_gradients(bii + 1)
+                if bii % 10 == 0:
+                    sys.stdout.write('\r[Epoch %i]  %i batches mean %.5f' % (epoch, bii, np.mean(c)))
+                    sys.stdout.flush()
+
+            self.apply_gradients(len(c), last=True)
+            curr_mean = np.mean(c)
+            diff_mean, last_mean = curr_mean-last_mean, curr_mean
+            sys.stdout.write('\r[Epoch %i] 100.0%% mean %.5f diff %.5f %s' %
+                (epoch, curr_mean, diff_mean, str(datetime.now())[11:19]))
+            sys.stdout.flush()
+
+            self.optimizer.sync()
+            self.checkpointer(networks[0], filename, epoch, curr_mean)
+
+        self.checkpointer.close(networks[0], filename)
+
+    def fit(self, network, train_func, variables, n_batches, filename=None, state=None):
+        """
+        Trains ``network`` by calling ``train_func(i)`` on the batches ``i``
+        of every epoch in a random order, resuming from the training state
+        ``state`` if it exists and writing it with the checkpoints.
+
+        :type variables: list
+        :param variables: the cost and update expressions of ``train_func``,
+        whose random states are part of the training state
+
+        :type n_batches: int
+        :param n_batches: number of batches of an epoch
+        """
+
+        self.random_states = random_states(variables)
+
+        position = self.restore(state)
+        last_mean = position['last_mean']
+        for epoch in range(position['epoch'], self.epochs):
+
+            if position['order'] is not None and epoch == position['epoch']:
+                batchinds, first, c = position['order'], position['batch'], position['costs']
+            else:
+                batchinds = np.arange(n_batches)
+                self.rng.shuffle(batchinds)
+                first, c = 0, []
+
+            sys.stdout.write('\n')
+
+            for bii, bi in enumerate(batchinds[first:], first):
+                c.append(train_func(bi))
+                if np.isnan(c[-1]): return self.optimizer.sync()
+                self.apply_gradients(bii + 1)
+                if state is not None and (bii + 1) % self.accumulate == 0 and self.checkpointer.timed():
+                    self.optimizer.sync()
+                    self.checkpointer.interim(network, filename,
+                        self.training_state(state, epoch, bii + 1, batchinds, c, last_mean))
+                if bii % (int(len(batchinds) / 1000) + 1) == 0:
+                    sys.stdout.write('\r[Epoch %i]  %0.1f%% mean %.5f' % (epoch, 100 * float(bii)/len(batchinds), np.mean(c)))
+                    sys.stdout.flush()
+
+            self.apply_gradients(len(c), last=True)
+            curr_mean = np.mean(c)
+            diff_mean, last_mean = curr_mean-last_mean, curr_mean
+            sys.stdout.write('\r[Epoch %i] 100.0%% mean %.5f diff %.5f %s' %
+                (epoch, curr_mean, diff_mean, str(datetime.now())[11:19]))
+            sys.stdout.flush()
+
+            self.optimizer.sync()
+            self.checkpointer(network, filename, epoch, curr_mean,
+                self.training_state(state, epoch + 1, last_mean=last_mean))
+
+        self.checkpointer.close(network, filename, self.training_state(state, self.epochs, last_mean=last_mean))
@@ -0,0 +1,95 @@
+import sys
+import threading
+import numpy as np
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class BatchPrefetcher(object):
+
+    def __init__(self, source, order=None, size=4, workers=1):
+        """
+        Prepares minibatches on background threads while the training
+        function runs, so that batch N+1 is ready once batch N is done.
+
+        :type source: iterable or dataset object
+        :param source: either an iterable of batches, or an object with
+        ``__len__`` and ``__getitem__`` returning batch ``i``. A batch is a
+        tuple of arrays, one per input of the training function.
+
+        :type order: numpy.ndarray
+        :param order: order in which the batches of a dataset object are
+        read, all batches in sequence by default
+
+        :type size: int
+        :param size: number of batches each worker prepares ahead
+
+        :type workers: int
+        :param workers: number of threads reading a dataset object. Batches
+        are still returned in ``order``. Iterables are always read by a
+        single thread.
+        """
+
+        self.source = source
+        self.indexed = hasattr(source, '__getitem__') and hasattr(source, '__len__')
+        self.order = order
+        self.size = size
+        self.workers = workers if self.indexed else 1
+        self.stopped = threading.Event()
+
+    def __len__(self):
+        if self.order is not None: return len(self.order)
+        return len(self.source)
+
+    def put(self, q, item):
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce(self, q, batches):
+        try:
+            for batch in batches:
+                if self.stopped.is_set(): return
+                self.put(q, (True, batch))
+        except Exception:
+            self.put(q, (False, sys.exc_info()))
+            return
+        self.put(q, (False, None))
+
+    def __iter__(self):
+
+        self.stopped.clear()
+
+        if self.indexed:
+            order = np.arange(len(self.source)) if self.order is None else self.order
+            batches = [(self.source[i] for i in order[w::self.workers])
+                       for w in range(self.workers)]
+        else:
+            batches = [iter(self.source)]
+
+        queues = [queue.Queue(maxsize=self.size) for w in range(self.workers)]
+        threads = [threading.Thread(target=self.produce, args=(q, b))
+                   for q, b in zip(queues, batches)]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Worker w prepares batches w, w+workers, w+2*workers, ... so reading
+        # the queues in turn gives the batches back in order
+        try:
+            w = 0
+            while True:
+                ok, item = queues[w].get()
+                if not ok:
+                    if item is None: return
+                    raise item[1]
+                yield item
+                w = (w + 1) % self.workers
+        finally:
+            self.stopped.set()
@@ -0,0 +1,324 @@
+""" Asynchronous checkpoints of networks and of the training state.
+
+A checkpoint holds the same files as ``network.save(filename)``: one
+``.npz`` per layer with a filename, holding the parameters of the layer
+under the names its ``load`` reads, ``W`` and ``b`` for most layers, and
+for the LSTM layers the names of their sublayers prefixed as in their
+``save`` and ``load``, e.g. ``RE_W``. Layers whose ``save`` writes nothing,
+such as ``BatchNormLayer``, get no file. ``load_checkpoint`` reads a
+checkpoint back into a network, including the layers whose own ``load``
+cannot.
+
+All files of a checkpoint, and the training state written with it, are
+replaced together: every file is first written next to its destination,
+then a journal listing all renames is written next to every destination,
+and only once all journals exist are the files renamed and the journals
+removed. A reader that finds a journal, ``read_state`` and
+``load_checkpoint`` call ``recover``, completes or drops an interrupted
+checkpoint first, so it never sees a mix of old and new files. Files read
+with ``network.load`` instead should be passed to ``recover`` first.
+"""
+
+import os
+import pickle
+import threading
+import time
+import numpy as np
+
+# Prefixes under which the LSTM layers (e.g. ``LSTM1DLayer``) save and load
+# the parameters of their sublayers
+SUBLAYER_PREFIXES = {
+    'encoder': 'RE_', 'recoder': 'RR_',
+    'encode_igate': 'RGei_', 'recode_igate': 'RGri_',
+    'encode_fgate': 'RGef_', 'recode_fgate': 'RGrf_',
+}
+
+def _save_nothing(self, filename): pass
+
+def saves_nothing(layer):
+    """ Returns whether the ``save`` of ``layer`` writes nothing, as that of ``BatchNormLayer`` """
+    save = getattr(type(layer), 'save', None)
+    code = getattr(getattr(save, '__func__', save), '__code__', None)
+    if code is None: return False
+    return (code.co_code == _save_nothing.__code__.co_code and
+            code.co_consts == _save_nothing.__code__.co_consts)
+
+def named_params(layer, prefix=''):
+    """
+    Returns ``(name, param)`` for every parameter of ``layer``, named after
+    the attribute holding it, ``W`` and ``b`` for most layers, as its
+    ``save`` writes them. Parameters of sublayers, such as the gates of the
+    LSTM layers, are prefixed as in ``SUBLAYER_PREFIXES``, e.g. ``RE_W``, or
+    else with the name of the sublayer.
+    """
+
+    named = []
+    params = list(getattr(layer, 'params', []))
+    for name, value in sorted(vars(layer).items()):
+        if any(value is p for p in params):
+            named.append((prefix + name, value))
+        elif hasattr(value, 'params') and hasattr(value, 'save') and value is not layer:
+            named += named_params(value, prefix + SUBLAYER_PREFIXES.get(name, name + '_'))
+
+    found = set(id(p) for _, p in named)
+    named += [('%sparam_%i' % (prefix, i), p) for i, p in enumerate(params) if id(p) not in found]
+    return named
+
+def layer_arrays(layer):
+    """ Returns copies of the values of the parameters of ``layer`` by name, none if its ``save`` writes nothing """
+    if saves_nothing(layer): return {}
+    return dict((name, p.get_value()) for name, p in named_params(layer))
+
+def network_layers(network):
+    """ Returns the layers of a network in the order of its filenames, None if unknown """
+    if hasattr(network, 'layers'): return network.layers
+    if hasattr(network, 'encoding_layers'): return network.encoding_layers + network.decoding_layers
+    if hasattr(network, 'network'): return network_layers(network.network)
+    return None
+
+def network_files(network, filename):
+    """
+    Returns ``(filename, arrays)`` for every layer of ``network`` that has a
+    filename, following nested lists of filenames into nested networks, or
+    None if the layers of a network are unknown
+    """
+
+    layers = network_layers(network)
+    if layers is None: return None
+
+    files = []
+    for fname, layer in zip(filename, layers):
+        if fname is None: continue
+        if isinstance(fname, (list, tuple)):
+            nested = network_files(layer, fname)
+            if nested is None: return None
+            files += nested
+        else:
+            arrays = layer_arrays(layer)
+            if arrays: files.append((fname, arrays))
+    return files
+
+class Checkpointer(object):
+
+    def __init__(self, every=1, seconds=None, best=False, validation=None):
+        """
+        Saves networks the way ``network.save(filename)`` does, without
+        holding up training: the parameter values are copied with
+        ``get_value`` on the training thread and compressed and written on a
+        background thread. The files of a checkpoint replace the previous
+        ones together (see the module docstring), so a crash while writing
+        leaves either the previous or the new checkpoint.
+
+        :type every: int
+        :param every: write every ``every`` epochs, None to never write by
+        epoch count
+
+        :type seconds: float
+        :param seconds: also write whenever ``seconds`` have passed since the
+        last write
+
+        :type best: bool
+        :param best: instead of the above, write exactly the epochs whose
+        score is lower than that of every epoch before
+
+        :type validation: function
+        :param validation: returns the score of the network for ``best``,
+        e.g. the cost on a validation set. The training cost of the epoch is
+        used if None.
+
+        A checkpoint can also carry the complete training state of a trainer,
+        see ``read_state``. The state is written whenever ``every`` or
+        ``seconds`` say so, also with ``best``, and with ``seconds`` also
+        within epochs (see ``interim``), so a resumed job loses at most one
+        interval of training.
+        """
+
+        self.every = every
+        self.seconds = seconds
+        self.best = best
+        self.validation = validation
+
+        self.best_score = np.inf
+        self.last_time = time.time()
+        self.pending = None
+        self.unsaved = False
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.error = None
+
+    def timed(self):
+        """ Returns whether ``seconds`` have passed since the last write """
+        return self.seconds is not None and time.time() - self.last_time >= self.seconds
+
+    def periodic(self, epoch):
+        """ Returns whether ``every`` or ``seconds`` call for a write after ``epoch`` """
+        return (self.every is not None and (epoch + 1) % self.every == 0) or self.timed()
+
+    def improved(self, score=None):
+        """ Returns whether the score of the network is the best so far, and remembers it """
+        if self.validation is not None: score = self.validation()
+        if score is None or not score < self.best_score: return False
+        self.best_score = score
+        return True
+
+    def __call__(self, network, filename, epoch, score=None, state=None):
+        """
+        Writes a checkpoint of ``network`` after ``epoch`` if one is due, and
+        the training state ``(state_filename, state)`` if given
+        """
+        periodic = self.periodic(epoch)
+        weights = filename is not None and (self.improved(score) if self.best else periodic)
+        if not weights and not (periodic and state is not None):
+            self.unsaved = True
+            return
+        self.save(network if weights else None, filename, state)
+
+    def interim(self, network, filename, state):
+        """ Writes the training state within an epoch, with the network unless ``best``, once ``seconds`` have passed """
+        if not self.timed(): return
+        self.save(None if self.best else network, filename, state)
+
+    def save(self, network, filename, state=None):
+        """
+        Snapshots ``network`` and writes it to ``filename``, and the training
+        state ``(state_filename, state)`` if given, in the background
+        """
+
+        if self.error is not None: raise self.error
+
+        files = []
+        if network is not None and filename is not None:
+            files = network_files(network, filename)
+            if files is None:
+                network.save(filename)
+                files = []
+
+        self.last_time = time.time()
+        self.unsaved = False
+
+        # A snapshot still waiting to be written is superseded file by file
+        with self.lock:
+            if self.pending is None:
+                self.pending = (files, state)
+            else:
+                names = set(fname for fname, _ in files)
+                waiting, waiting_state = self.pending
+                self.pending = ([f for f in waiting if f[0] not in names] + files,
+                                waiting_state if state is None else state)
+            if self.running: return
+            self.running = True
+            self.thread = threading.Thread(target=self.run)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                pending, self.pending = self.pending, None
+                if pending is None:
+                    self.running = False
+                    return
+            try:
+                write_files(*pending)
+            except Exception as e:
+                self.error = e
+
+    def close(self, network=None, filename=None, state=None):
+        """ Writes the last epoch if it was skipped by ``every`` or ``seconds`` and waits for all writes """
+        if self.unsaved: self.save(None if self.best else network, filename, state)
+        if self.thread is not None: self.thread.join()
+        if self.error is not None: raise self.error
+
+def npz_filename(filename):
+    return filename if filename.endswith('.npz') else filename + '.npz'
+
+def read_state(filename):
+    """ Returns the training state written with a checkpoint, None if there is none """
+    if filename is None: return None
+    recover(filename)
+    if not os.path.isfile(filename): return None
+    with open(filename, 'rb') as f: return pickle.load(f)
+
+def load_checkpoint(network, filename):
+    """
+    Sets the parameters of ``network`` to those of the checkpoint written to
+    ``filename``, the filenames ``network.save`` takes
+    """
+
+    layers = network_layers(network)
+    if layers is None: return network.load(filename)
+
+    for fname, layer in zip(filename, layers):
+        if fname is None: continue
+        if isinstance(fname, (list, tuple)):
+            load_checkpoint(layer, fname)
+            continue
+        fname = npz_filename(fname)
+        recover(fname)
+        if saves_nothing(layer) or not os.path.isfile(fname): continue
+        data = np.load(fname)
+        for name, p in named_params(layer):
+            p.set_value(data[name].astype(p.dtype))
+
+def journal_filename(filename):
+    return filename + '.journal'
+
+def recover(filename):
+    """
+    Completes the checkpoint whose writing was interrupted while renaming its
+    files, if ``filename`` belongs to one
+    """
+
+    journal = journal_filename(filename)
+    if not os.path.isfile(journal): return
+    with open(journal, 'rb') as f: renames = pickle.load(f)
+
+    # The files are only renamed once the journals of all of them are
+    # written, so with any journal missing either none was renamed yet, and
+    # the new files are dropped, or all were and only journals are left
+    complete = all(os.path.isfile(journal_filename(final)) for _, final in renames)
+    for tmp, final in renames:
+        if not os.path.exists(tmp): continue
+        if complete: os.rename(tmp, final)
+        else: os.remove(tmp)
+    for _, final in renames:
+        if os.path.exists(journal_filename(final)): os.remove(journal_filename(final))
+
+def write_files(files, state=None):
+    """
+    Writes ``(filename, arrays)`` pairs as ``.npz`` files, and the training
+    state ``(filename, state)`` as a pickle, replacing the old files only
+    once all are written
+    """
+
+    targets = [(npz_filename(fname), lambda f, arrays=arrays: np.savez_compressed(f, **arrays))
+               for fname, arrays in files]
+    if state is not None:
+        targets.append((state[0], lambda f: pickle.dump(state[1], f, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    # Any earlier checkpoint interrupted while renaming is completed first
+    for final, _ in targets: recover(final)
+
+    written = []
+    try:
+        for final, write in targets:
+            written.append(('%s.tmp%i' % (final, os.getpid()), final))
+            with open(written[-1][0], 'wb') as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        for _, final in written:
+            journal = journal_filename(final)
+            with open(journal + '.tmp', 'wb') as f:
+                pickle.dump(written, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(journal + '.tmp', journal)
+    except Exception:
+        for tmp, final in written:
+            if os.path.exists(tmp): os.remove(tmp)
+            if os.path.exists(journal_filename(final)): os.remove(journal_filename(final))
+        raise
+
+    for tmp, final in written: os.rename(tmp, final)
+    for _, final in written: os.remove(journal_filename(final))
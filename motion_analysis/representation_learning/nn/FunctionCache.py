@@ -0,0 +1,114 @@
+""" On-disk cache of compiled Theano functions.
+
+Optimising and compiling the graph of a large network takes minutes, and a
+relaunched experiment compiles exactly the same graph again.
+``cached_function`` is a drop-in replacement for ``theano.function`` that
+pickles the optimised function into ``functions/`` of the preprocessing
+cache directory (see ``tools/cache.py``), keyed by a hash of the graph, the
+shapes of its shared variables, the compile arguments and the Theano
+configuration. The values of the shared variables, which include whole
+datasets for functions slicing them with ``givens``, are not stored.
+
+On a hit the optimised graph is unpickled without optimising it again, and
+the shared variables it was pickled with, parameters, optimiser state and
+random states, are swapped for the ones of the current graph, so the
+function reads and updates the same variables a freshly compiled one would.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import numpy as np
+import theano
+
+from theano.gof import graph
+
+from tools.cache import cache_dir
+
+function_dir = os.path.join(cache_dir, 'functions')
+
+# Set to False to always compile functions from scratch
+enabled = True
+
+def _shared_variables(variables):
+    """ Returns the shared variables of a graph, in the order of a depth-first traversal """
+    return [v for v in graph.inputs(variables) if isinstance(v, theano.compile.SharedVariable)]
+
+def _graph_variables(outputs, updates, givens):
+    """ Returns the outputs, the update expressions and the updated variables with ``givens`` applied """
+    outputs = outputs if isinstance(outputs, (list, tuple)) else [outputs]
+    updates = list(updates.items()) if isinstance(updates, dict) else list(updates or [])
+    variables = list(outputs) + [u for _, u in updates]
+    if givens: variables = theano.clone(variables, replace=givens)
+    return variables + [v for v, _ in updates]
+
+def _placeholder(variable):
+    """ Returns an empty shared variable of the type of ``variable``, which is pickled instead of it """
+    broadcastable = getattr(variable.type, 'broadcastable', None)
+    if broadcastable is None: return variable
+    return theano.shared(np.zeros([1 if b else 0 for b in broadcastable], dtype=variable.dtype),
+                         broadcastable=broadcastable)
+
+def function_key(inputs, outputs, updates=None, givens=None, **kwargs):
+    """ Returns the cache key of the function ``theano.function`` would compile from these arguments """
+
+    variables = _graph_variables(outputs, updates, givens)
+
+    sha = hashlib.sha1()
+    sha.update(theano.printing.debugprint(variables, file='str', print_type=True).encode('utf-8'))
+    sha.update(repr([i.type for i in inputs]).encode('utf-8'))
+    for v in graph.inputs(variables):
+        if isinstance(v, theano.compile.SharedVariable):
+            sha.update(repr((v.type, v.get_value(borrow=True).shape)).encode('utf-8'))
+        elif isinstance(v, graph.Constant):
+            sha.update(np.asarray(v.data).tobytes())
+    sha.update(repr(sorted(kwargs.items())).encode('utf-8'))
+    sha.update(repr((theano.__version__, theano.config.floatX, theano.config.device,
+                     theano.config.mode, theano.config.optimizer)).encode('utf-8'))
+    return sha.hexdigest()
+
+def cached_function(inputs, outputs, updates=None, givens=None, **kwargs):
+    """
+    Returns ``theano.function(inputs, outputs, updates=updates,
+    givens=givens, **kwargs)``, loaded from the cache when the same function
+    has been compiled before.
+    """
+
+    if not enabled:
+        return theano.function(inputs, outputs, updates=updates, givens=givens, **kwargs)
+
+    shared = _shared_variables(_graph_variables(outputs, updates, givens))
+    filename = os.path.join(function_dir, function_key(inputs, outputs, updates, givens, **kwargs) + '.pkl')
+
+    if os.path.isfile(filename):
+        try:
+            reoptimize = theano.config.reoptimize_unpickled_function
+            theano.config.reoptimize_unpickled_function = False
+            try:
+                with open(filename, 'rb') as fh: positions, f_cached = pickle.load(fh)
+            finally:
+                theano.config.reoptimize_unpickled_function = reoptimize
+            cached = [i.variable for i in f_cached.maker.inputs if i.shared]
+            return f_cached.copy(swap=dict((c, shared[p]) for c, p in zip(cached, positions)))
+        except Exception as e:
+            sys.stdout.write('... recompiling, cached function unusable (%s)\n' % e)
+
+    f = theano.function(inputs, outputs, updates=updates, givens=givens, **kwargs)
+
+    # Shared variables added by theano.function itself, such as those of
+    # random streams without updates, cannot be swapped back in
+    positions = [shared.index(i.variable) if i.variable in shared else None
+                 for i in f.maker.inputs if i.shared]
+    if None in positions: return f
+
+    try:
+        if not os.path.isdir(function_dir): os.makedirs(function_dir)
+        tmp = '%s.tmp%i' % (filename, os.getpid())
+        stored = f.copy(swap=dict((i.variable, _placeholder(i.variable)) for i in f.maker.inputs if i.shared))
+        with open(tmp, 'wb') as fh: pickle.dump((positions, stored), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, filename)
+    except Exception as e:
+        sys.stdout.write('... function not cached (%s)\n' % e)
+
+    return f
@@ -38,9 +38,11 @@ class Pool1DLayer:
         
     def __call__(self, input):
         
+        # Symbolic shapes, so the layer also pools inputs with fewer frames
+        # than ``input_shape``, e.g. the coarse levels of a temporal pyramid
         return self.pooler(input.reshape((
-            self.input_shape[0], self.input_shape[1], 
-            self.input_shape[2]//self.pool_shape[0],
+            input.shape[0], input.shape[1], 
+            input.shape[2]//self.pool_shape[0],
             self.pool_shape[0])), axis=3)
         
     def inv(self, output):
@@ -59,7 +61,7 @@ class Pool1DLayer:
         else:
             output = self.depooler(output, axis=3)
         
-        return output.reshape(self.input_shape)
+        return output.reshape((output.shape[0], output.shape[1], output.shape[2] * self.pool_shape[0]))
         
     def load(self, filename): pass
     def save(self, filename): pass
@@ -5,6 +5,9 @@ import theano.tensor as T
 from theano.tensor.shared_randomstreams import RandomStreams
 from datetime import datetime
 
+from nn.AdamOptimizer import AdamOptimizer
+from nn.FunctionCache import cached_function
+
 class AdamTrainer:
     
     def __init__(self, rng, batchsize, misc_cost, dec_cost, disc_cost, epochs=100, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-08, gamma=0.1):
@@ -46,54 +49,23 @@ class AdamTrainer:
         
     def get_cost_updates(self, misc_network, dec_network, disc_network, input_joint, input_control, output, rand_input):
         misc_cost = (self.misc_cost(misc_network, dec_network, input_joint, input_control, output) + self.gamma * self.regularization(misc_network))
-        misc_gparams = T.grad(misc_cost, self.misc_params)
-
-        misc_m0params = [self.misc_beta1 * m0p + (1-self.misc_beta1) *  gp     for m0p, gp in zip(self.misc_m0params, misc_gparams)]
-        misc_m1params = [self.misc_beta2 * m1p + (1-self.misc_beta2) * (gp*gp) for m1p, gp in zip(self.misc_m1params, misc_gparams)]
-        
-        misc_params = [p - (self.misc_alpha / self.batchsize) * 
-                  ((m0p/(1-(self.misc_beta1**self.misc_t[0]))) /
-            (T.sqrt(m1p/(1-(self.misc_beta2**self.misc_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(self.misc_params, misc_m0params, misc_m1params)]
-        
-        updates = ([( p,  pn) for  p,  pn in zip(self.misc_params, misc_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.misc_m0params, misc_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.misc_m1params, misc_m1params)] +
-                   [(self.misc_t, self.misc_t+1)])
-        
         dec_cost = (self.dec_cost(misc_network, dec_network, disc_network, input_joint, input_control, output, rand_input) + self.gamma * self.regularization(dec_network))
-        dec_gparams = T.grad(dec_cost, self.dec_params)
-
-        dec_m0params = [self.dec_beta1 * m0p + (1-self.dec_beta1) *  gp     for m0p, gp in zip(self.dec_m0params, dec_gparams)]
-        dec_m1params = [self.dec_beta2 * m1p + (1-self.dec_beta2) * (gp*gp) for m1p, gp in zip(self.dec_m1params, dec_gparams)]
-        
-        dec_params = [p - (self.dec_alpha / self.batchsize) * 
-                  ((m0p/(1-(self.dec_beta1**self.dec_t[0]))) /
-            (T.sqrt(m1p/(1-(self.dec_beta2**self.dec_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(self.dec_params, dec_m0params, dec_m1params)]
-        
-        updates += ([( p,  pn) for  p,  pn in zip(self.dec_params, dec_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.dec_m0params, dec_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.dec_m1params, dec_m1params)] +
-                   [(self.dec_t, self.dec_t+1)])
-
         disc_cost = (self.disc_cost(misc_network, dec_network, disc_network, input_joint, input_control, output, rand_input) + self.gamma * self.regularization(disc_network))
-        disc_gparams = T.grad(disc_cost, self.disc_params)
 
-        disc_m0params = [self.disc_beta1 * m0p + (1-self.disc_beta1) *  gp     for m0p, gp in zip(self.disc_m0params, disc_gparams)]
-        disc_m1params = [self.disc_beta2 * m1p + (1-self.disc_beta2) * (gp*gp) for m1p, gp in zip(self.disc_m1params, disc_gparams)]
-        
-        disc_params = [p - (self.disc_alpha / self.batchsize) * 
-                  ((m0p/(1-(self.disc_beta1**self.disc_t[0]))) /
-            (T.sqrt(m1p/(1-(self.disc_beta2**self.disc_t[0]))) + self.eps))
-            for p, m0p, m1p in zip(self.disc_params, disc_m0params, disc_m1params)]
-        
-        updates += ([( p,  pn) for  p,  pn in zip(self.disc_params, disc_params)] +
-                   [(m0, m0n) for m0, m0n in zip(self.disc_m0params, disc_m0params)] +
-                   [(m1, m1n) for m1, m1n in zip(self.disc_m1params, disc_m1params)] +
-                   [(self.disc_t, self.disc_t+1)])
+        # Every cost depends on the parameters of all three networks
+        misc_cost, dec_cost, disc_cost = self.misc_optimizer.clone(
+            [misc_cost, dec_cost, disc_cost], self.dec_optimizer, self.disc_optimizer)
+
+        updates = (self.misc_optimizer.updates(misc_cost) +
+                   self.dec_optimizer.updates(dec_cost) +
+                   self.disc_optimizer.updates(disc_cost))
 
         return (misc_cost, dec_cost, disc_cost, updates)
+
+    def sync(self):
+        """ Writes the trained values back into the parameters of all three networks """
+        for optimizer in [self.misc_optimizer, self.dec_optimizer, self.disc_optimizer]:
+            optimizer.sync()
         
     def train(self, misc_network, dec_network, disc_network, input_motion_data, input_control_data, output_data, f_misc, f_dec):
 
@@ -109,23 +81,17 @@ class AdamTrainer:
         rand_input = T.tensor3()
 
         self.misc_params = misc_network.params
-        self.misc_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.misc_params]
-        self.misc_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.misc_params]
-        self.misc_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.misc_optimizer = AdamOptimizer(self.misc_params, self.misc_alpha / self.batchsize, self.misc_beta1, self.misc_beta2, self.eps)
         
         self.dec_params = dec_network.params
-        self.dec_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.dec_params]
-        self.dec_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.dec_params]
-        self.dec_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.dec_optimizer = AdamOptimizer(self.dec_params, self.dec_alpha / self.batchsize, self.dec_beta1, self.dec_beta2, self.eps)
 
         self.disc_params = disc_network.params
-        self.disc_m0params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.disc_params]
-        self.disc_m1params = [theano.shared(np.zeros(p.shape.eval(), dtype=theano.config.floatX), borrow=True) for p in self.disc_params]
-        self.disc_t = theano.shared(np.array([1], dtype=theano.config.floatX))
+        self.disc_optimizer = AdamOptimizer(self.disc_params, self.disc_alpha / self.batchsize, self.disc_beta1, self.disc_beta2, self.eps)
         
         misc_cost, dec_cost, disc_cost, updates = self.get_cost_updates(misc_network, dec_network, disc_network, input_motion, input_control, output, rand_input)
 
-        train_func = theano.function(inputs=[index, rand_input], 
+        train_func = cached_function(inputs=[index, rand_input], 
             outputs=[misc_cost, dec_cost, disc_cost], 
             updates=updates, 
             givens={
@@ -142,7 +108,7 @@ class AdamTrainer:
 
         for epoch in range(self.epochs):
                      
-            batchinds = np.arange(input_motion_data.shape.eval()[0] // self.batchsize)
+            batchinds = np.arange(input_motion_data.get_value(borrow=True).shape[0] // self.batchsize)
             self.rng.shuffle(batchinds)
             
             sys.stdout.write('\n')            
@@ -162,21 +128,25 @@ class AdamTrainer:
                 misc_costs.append(misc_cost_)
                 if np.isnan(misc_costs[-1]):
                     print "NaN in misc cost."
+                    self.sync()
                     return
 
                 dec_costs.append(dec_cost_)
                 if np.isnan(dec_costs[-1]):
                     print "NaN in decoder cost."
+                    self.sync()
                     return                    
 
                 disc_costs.append(np.absolute(2-disc_cost_))
                 if np.isnan(disc_costs[-1]):
                     print "NaN in discriminator cost."
+                    self.sync()
                     return
 
             misc_cost_mean.append(np.mean(misc_costs))
             dec_cost_mean.append(np.mean(dec_costs))
             disc_cost_mean.append(np.mean(disc_costs))
 
+            self.sync()
             misc_network.save(f_misc)
             dec_network.save(f_dec)
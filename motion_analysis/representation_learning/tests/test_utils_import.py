@@ -0,0 +1,34 @@
+""" ``tools.utils`` has to stay cheap to import: the loaders only need numpy. """
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing theano or matplotlib alone takes longer than this
+BUDGET = 2.0
+
+SCRIPT = """
+import json, sys, time
+start = time.time()
+import tools.utils
+print(json.dumps({'seconds': time.time() - start,
+                  'theano': 'theano' in sys.modules,
+                  'matplotlib': 'matplotlib' in sys.modules}))
+"""
+
+class TestUtilsImport(unittest.TestCase):
+
+    def test_import(self):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        self.assertFalse(result['theano'], 'tools.utils imports theano')
+        self.assertFalse(result['matplotlib'], 'tools.utils imports matplotlib')
+        self.assertLess(result['seconds'], BUDGET,
+            'importing tools.utils took %.2fs' % result['seconds'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+""" Vectorised motion augmentation.
+
+Clips are laid out as in the loaders: 21 root-local joint positions (63
+channels), root velocity along x and z, root rotational velocity around y,
+and optionally four foot contacts. ``Augmenter`` applies, to a whole batch
+at once and without any per-frame loops,
+
+    mirroring       left and right joints swapped and x negated
+    heading jitter  root velocity rotated around y by a small random angle
+    time warping    clips resampled at a random speed
+    joint dropout   random joints set to zero after normalisation
+
+The augmentations act on unnormalised motion, so an ``Augmenter`` given the
+loaders' ``Xmean`` and ``Xstd`` denormalises a batch first and normalises
+it again afterwards.
+
+Padded batches, such as those of ``BucketSampler``, come with a mask of the
+real frames. Time warping moves the real frames, so the mask is warped along
+with the clips, and the padding, which the other augmentations make nonzero,
+is zeroed again afterwards.
+
+``AugmentedBatches`` runs an ``Augmenter`` over the batches of any batch
+source in a pool of worker processes and can be passed to ``train_batches``
+of the trainers.
+"""
+
+import collections
+import multiprocessing
+import numpy as np
+
+from nn.Quaternions import Quaternions
+from tools.dataset import channel_groups
+
+# Joints as in nn/AnimationPlotLines.py: root, two legs of four joints, spine,
+# neck and head, then two arms of four joints
+MIRROR = np.array([0, 5, 6, 7, 8, 1, 2, 3, 4, 9, 10, 11, 12, 17, 18, 19, 20, 13, 14, 15, 16])
+
+# Heel and toe of the left foot, then of the right foot
+MIRROR_CONTACTS = np.array([2, 3, 0, 1])
+
+def mirror(X, contacts=False):
+    """ Mirrors clips of shape (clips, channels, frames) along x """
+
+    X = X.copy()
+    groups = channel_groups(X.shape[1], contacts)
+
+    joints = X[:,groups['joints']].reshape((len(X), -1, 3, X.shape[2]))
+    joints = joints[:,MIRROR]
+    joints[:,:,0] *= -1
+    X[:,groups['joints']] = joints.reshape((len(X), -1, X.shape[2]))
+
+    root = groups['root'].start
+    X[:,root] *= -1
+    X[:,root+2] *= -1
+
+    if contacts:
+        X[:,groups['contacts']] = X[:,groups['contacts']][:,MIRROR_CONTACTS]
+
+    return X
+
+def rotate_root(X, angles, contacts=False):
+    """
+    Rotates the root velocity of every clip around y by ``angles``. The
+    joints are root-local and the root velocity is expressed in the facing
+    frame of the character, in which rotating the whole motion around y
+    changes nothing. This instead turns the direction of travel against the
+    facing direction, so only small angles give plausible motion.
+    """
+
+    X = X.copy()
+    root = channel_groups(X.shape[1], contacts)['root'].start
+
+    velocity = np.zeros((len(X), X.shape[2], 3))
+    velocity[:,:,0] = X[:,root]
+    velocity[:,:,2] = X[:,root+1]
+
+    rotations = Quaternions.from_angle_axis(np.asarray(angles, dtype=np.float64), np.array([0,1,0]))
+    velocity = Quaternions(rotations.qs[:,np.newaxis]) * velocity
+
+    X[:,root] = velocity[:,:,0]
+    X[:,root+1] = velocity[:,:,2]
+    return X
+
+def warp_times(n_frames, speeds, offsets=None):
+    """
+    Returns the time ``t`` of every resampled frame of ``time_warp`` in the
+    original clip, of shape (clips, frames), together with the frames before
+    and after it and the interpolation weight of the frame after it
+    """
+
+    speeds = np.asarray(speeds, dtype=np.float64)
+    offsets = np.zeros(len(speeds)) if offsets is None else np.asarray(offsets)
+
+    spare = np.maximum(0, (n_frames - 1) * (1 - speeds))
+    t = np.clip((offsets * spare)[:,np.newaxis] + np.arange(n_frames) * speeds[:,np.newaxis], 0, n_frames - 1)
+    i0 = np.floor(t).astype(int)
+    i1 = np.minimum(i0 + 1, n_frames - 1)
+    return t, i0, i1, t - i0
+
+def time_warp_mask(mask, speeds, offsets=None):
+    """
+    Resamples a mask of the real frames of shape (clips, frames) as
+    ``time_warp`` resamples the clips: a resampled frame is real if the
+    frames it is interpolated from are
+    """
+
+    mask = np.asarray(mask)
+    t, i0, i1, w = warp_times(mask.shape[1], speeds, offsets)
+    clip = np.arange(len(mask))[:,np.newaxis]
+    return np.where(w > 0, mask[clip,i0] * mask[clip,i1], mask[clip,i0]).astype(mask.dtype)
+
+def time_warp(X, speeds, offsets=None, contacts=False):
+    """
+    Resamples every clip at the given speed, 2.0 playing the motion twice as
+    fast. Clips are linearly interpolated, the last frame is repeated when a
+    clip runs out of frames, and the root velocities are scaled by the speed.
+
+    :type offsets: numpy.ndarray
+    :param offsets: position of the first resampled frame, as a fraction of the
+    frames left over when slowing down, 0 by default
+    """
+
+    B, C, F = X.shape
+    t, i0, i1, w = warp_times(F, speeds, offsets)
+    w = w[:,np.newaxis]
+
+    clip = np.arange(B)[:,np.newaxis]
+    Y = ((1 - w) * X[clip,:,i0].swapaxes(1, 2) + w * X[clip,:,i1].swapaxes(1, 2)).astype(X.dtype)
+
+    groups = channel_groups(C, contacts)
+    Y[:,groups['root']] *= speeds[:,np.newaxis,np.newaxis]
+    if contacts:
+        nearest = np.round(t).astype(int)
+        Y[:,groups['contacts']] = X[clip,groups['contacts'],nearest].swapaxes(1, 2)
+
+    return Y
+
+def joint_dropout(rng, X, amount, contacts=False):
+    """ Sets every joint of every frame to zero with probability ``amount`` """
+
+    X = X.copy()
+    joints = channel_groups(X.shape[1], contacts)['joints']
+    n_joints = (joints.stop - joints.start) // 3
+
+    keep = rng.uniform(size=(len(X), n_joints, 1, X.shape[2])) >= amount
+    shape = (len(X), n_joints, 3, X.shape[2])
+    X[:,joints] = (X[:,joints].reshape(shape) * keep).reshape((len(X), -1, X.shape[2]))
+    return X
+
+class Augmenter(object):
+
+    def __init__(self, mirror=0.5, rotation=0.0, speeds=(0.8, 1.25), dropout=0.0,
+                 contacts=False, Xmean=None, Xstd=None):
+        """
+        :type mirror: float
+        :param mirror: probability of mirroring a clip
+
+        :type rotation: float
+        :param rotation: root velocities are rotated by an angle drawn from
+        [-rotation, rotation], which perturbs the heading against the facing
+        direction rather than rotating the motion (see ``rotate_root``), so
+        it should be kept to a small jitter of a few degrees; 0 by default
+
+        :type speeds: tuple
+        :param speeds: (slowest, fastest) time warping speed, drawn uniformly
+        on a log scale; None disables time warping
+
+        :type dropout: float
+        :param dropout: probability of dropping a joint in a frame
+
+        :type contacts: bool
+        :param contacts: whether the last four channels are foot contacts
+
+        :type Xmean, Xstd: numpy.ndarray
+        :param Xmean, Xstd: normalisation of the clips, as returned by the
+        loaders, None if the clips are not normalised
+        """
+
+        self.mirror = mirror
+        self.rotation = rotation
+        self.speeds = speeds
+        self.dropout = dropout
+        self.contacts = contacts
+        self.Xmean = Xmean
+        self.Xstd = Xstd
+
+    def __call__(self, rng, X, mask=None):
+        """
+        Augments the clips ``X``, or with a ``mask`` of their real frames of
+        shape (clips, frames), the clips and the mask, returned as ``(X,
+        mask)`` with the padding of ``X`` zero
+        """
+
+        if self.Xmean is not None:
+            X = X * (self.Xstd + 1e-10) + self.Xmean
+
+        if self.mirror > 0:
+            flip = rng.uniform(size=len(X)) < self.mirror
+            X = np.where(flip[:,np.newaxis,np.newaxis], mirror(X, self.contacts), X)
+
+        if self.rotation > 0:
+            X = rotate_root(X, rng.uniform(-self.rotation, self.rotation, size=len(X)), self.contacts)
+
+        if self.speeds is not None:
+            speeds = np.exp(rng.uniform(np.log(self.speeds[0]), np.log(self.speeds[1]), size=len(X)))
+            offsets = rng.uniform(size=len(X))
+            X = time_warp(X, speeds, offsets, self.contacts)
+            if mask is not None: mask = time_warp_mask(mask, speeds, offsets)
+
+        if self.Xmean is not None:
+            X = (X - self.Xmean) / (self.Xstd + 1e-10)
+
+        if self.dropout > 0:
+            X = joint_dropout(rng, X, self.dropout, self.contacts)
+
+        if mask is None: return X
+        return (X * mask[:,np.newaxis]).astype(X.dtype), mask
+
+def _augment(args):
+    augmenter, seed, X, mask = args
+    return augmenter(np.random.RandomState(seed), X, mask)
+
+class AugmentedBatches(object):
+
+    def __init__(self, source, augmenter, rng, processes=None, ahead=None, transform=None, mask=None):
+        """
+        Augments the batches of ``source`` in worker processes.
+
+        :type source: iterable
+        :param source: batches of clips, either arrays or tuples of the
+        arrays given to the training function whose first element is the
+        clips (e.g. a ``ShardReader``, ``WindowDataset`` or ``BucketSampler``).
+        Only the clips and their mask are augmented, the other elements, such
+        as labels, are passed on unchanged, except those that are the clips
+        themselves, such as the target of an autoencoder, which are replaced
+        as well.
+
+        :type augmenter: Augmenter
+        :param augmenter: the augmentation applied to every batch
+
+        :type rng: numpy.random.RandomState
+        :param rng: a random number generator used to seed the workers
+
+        :type processes: int
+        :param processes: number of worker processes, one per core by default
+
+        :type ahead: int
+        :param ahead: number of batches being augmented at any time, twice the
+        number of processes by default
+
+        :type transform: function
+        :param transform: maps an augmented batch of a source of arrays to
+        the tuple of arrays given to the training function, whose
+        ``get_cost_updates`` takes them after the networks, e.g. ``(input,
+        output)`` for ``AdamTrainer``. By default ``(X, X)``, the target of an
+        autoencoder.
+
+        :type mask: int
+        :param mask: position in the tuple batches of a mask of the real
+        frames of shape (clips, frames), which is augmented along with the
+        clips (see ``Augmenter``). By default the element of that shape, e.g.
+        the mask of ``(X, mask)`` batches of ``BucketSampler``; False if the
+        batches have no mask.
+        """
+
+        self.source = source
+        self.augmenter = augmenter
+        self.rng = rng
+        self.processes = processes or multiprocessing.cpu_count()
+        self.ahead = ahead or 2 * self.processes
+        self.transform = (lambda X: (X, X)) if transform is None else transform
+        self.mask = mask
+        self.pool = None
+
+    def __len__(self):
+        return len(self.source)
+
+    def __iter__(self):
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+
+        pending = collections.deque()
+        for batch in self.source:
+            X = batch[0] if isinstance(batch, tuple) else batch
+            m = self.mask_position(batch)
+            seed = self.rng.randint(2 ** 30)
+            args = (self.augmenter, seed, X, None if m is None else batch[m])
+            pending.append((batch, self.pool.apply_async(_augment, (args,))))
+            if len(pending) >= self.ahead:
+                yield self.prepare(*pending.popleft())
+
+        while pending:
+            yield self.prepare(*pending.popleft())
+
+    def mask_position(self, batch):
+        """ Returns the position of the mask in ``batch``, None if it has none """
+        if not isinstance(batch, tuple) or self.mask is False: return None
+        if self.mask is not None: return self.mask
+        shape = (np.shape(batch[0])[0], np.shape(batch[0])[-1])
+        for i, b in enumerate(batch[1:], 1):
+            if b is not batch[0] and np.shape(b) == shape: return i
+        return None
+
+    def prepare(self, batch, result):
+        """ Puts the augmented clips and mask of ``result`` back in place of those of ``batch`` """
+        X = result.get()
+        if not isinstance(batch, tuple): return self.transform(X)
+        m = self.mask_position(batch)
+        if m is not None: X, mask = X
+        return tuple(mask if i == m else X if b is batch[0] else b for i, b in enumerate(batch))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
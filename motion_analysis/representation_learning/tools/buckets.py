@@ -0,0 +1,145 @@
+""" Length-bucketed batches of variable-length takes.
+
+The loaders cut every take into clips of 240 frames, padding short takes and
+dropping the ends of long ones. ``BucketSampler`` instead batches whole takes
+(or pieces of at most ``max_length`` frames) of similar length together. A
+batch is padded only up to the length of its bucket and comes with a mask
+marking the real frames:
+
+    X       (clips, channels, frames), zero after the end of every take
+    mask    (clips, frames), 1 for frames of the take and 0 for padding
+
+The mask is laid out like the clips, as the ``masked_mse`` cost of
+``AdamTrainer`` and ``AugmentedBatches`` expect it. The ``mask`` sequence of
+``nn/LSTM.py`` is scanned along its first axis and so is (frames, clips):
+a mask given to an LSTM has to be transposed first, e.g. with ``mask.T`` in
+the graph.
+
+Every bucket has one fixed length, so a whole epoch uses only as many batch
+shapes as there are buckets, and ``train_batches`` of the trainers with
+``fixed_shapes=True`` compiles one training function per bucket and reuses
+it for every batch of that bucket. The ``masked_mse`` cost of
+``AdamTrainer`` averages the error over the real frames only.
+"""
+
+import numpy as np
+
+from tools.windows import Takes
+
+def bucket_bounds(lengths, n_buckets=8, granularity=8):
+    """
+    Returns the lengths of ``n_buckets`` buckets holding about equally many
+    of the given ``lengths``, each a multiple of ``granularity``
+    """
+    lengths = np.asarray(lengths)
+    quantiles = np.percentile(lengths, np.linspace(0, 100, n_buckets + 1)[1:])
+    bounds = (np.ceil(quantiles / granularity) * granularity).astype(int)
+    return np.unique(np.maximum(bounds, granularity))
+
+class BucketSampler(object):
+
+    def __init__(self, takes, rng, batchsize, bounds=None, n_buckets=8, granularity=8,
+                 max_length=None, min_length=1, Xmean=None, Xstd=None, transform=None):
+        """
+        A dataset object of length-bucketed batches for ``train_batches`` of
+        the trainers. Batch ``i`` is gathered from the takes on access, and the
+        batches are drawn again by calling ``shuffle``, which ``train_batches``
+        does before every epoch.
+
+        :type takes: Takes or list
+        :param takes: the takes to batch, or a list of (channels, frames)
+        arrays
+
+        :type batchsize: int
+        :param batchsize: number of takes per batch, takes that do not fill a
+        last batch of their bucket are left out until the next ``shuffle``,
+        and buckets with fewer takes than ``batchsize`` are never batched
+
+        :type bounds: list
+        :param bounds: length of every bucket, ``bucket_bounds`` of the take
+        lengths by default
+
+        :type max_length: int
+        :param max_length: takes longer than this are cut into consecutive
+        pieces of at most ``max_length`` frames, no limit by default
+
+        :type min_length: int
+        :param min_length: pieces shorter than this are dropped
+
+        :type Xmean, Xstd: numpy.ndarray
+        :param Xmean, Xstd: normalisation as returned by the loaders, the
+        padding stays zero
+
+        :type transform: function
+        :param transform: maps (X, mask) to the tuple of arrays given to the
+        training function, ``(X, mask)`` by default, with the mask as
+        (clips, frames), transposed from the (frames, clips) of ``nn/LSTM.py``
+        """
+
+        if not isinstance(takes, Takes): takes = Takes.from_list(takes)
+
+        self.takes = takes
+        self.rng = rng
+        self.batchsize = batchsize
+        self.Xmean = Xmean
+        self.Xstd = Xstd
+        self.transform = (lambda X, mask: (X, mask)) if transform is None else transform
+
+        # Pieces of every take, as first frame in ``takes.frames`` and length
+        lengths = np.diff(takes.offsets)
+        piece = lengths.max() if max_length is None else max_length
+        n = -(-lengths // piece)
+        take = np.repeat(np.arange(len(lengths)), n)
+        position = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        self.starts = takes.offsets[:-1][take] + position * piece
+        self.lengths = np.minimum(piece, takes.offsets[1:][take] - self.starts)
+
+        keep = self.lengths >= min_length
+        self.starts, self.lengths = self.starts[keep], self.lengths[keep]
+
+        self.bounds = np.asarray(bucket_bounds(self.lengths, n_buckets, granularity)
+                                 if bounds is None else sorted(bounds))
+        if self.lengths.max() > self.bounds[-1]:
+            raise ValueError('Takes of %i frames do not fit the longest bucket of %i frames'
+                             % (self.lengths.max(), self.bounds[-1]))
+        self.buckets = np.searchsorted(self.bounds, self.lengths)
+        self.shuffle()
+
+    def shuffle(self):
+        """ Shuffles the pieces within every bucket and forms new batches """
+        order = self.rng.permutation(len(self.starts))
+        order = order[np.argsort(self.buckets[order], kind='mergesort')]
+
+        counts = np.bincount(self.buckets, minlength=len(self.bounds))
+        full = (counts // self.batchsize) * self.batchsize
+        first = np.cumsum(counts) - counts
+        rank = np.arange(len(order)) - first[self.buckets[order]]
+        order = order[rank < full[self.buckets[order]]]
+
+        self.batches = order.reshape((-1, self.batchsize))
+        self.rng.shuffle(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def padding(self):
+        """ Returns the fraction of padded frames over all batches """
+        pieces = self.batches.ravel()
+        frames = self.bounds[self.buckets[pieces]]
+        return 1.0 - float(self.lengths[pieces].sum()) / frames.sum()
+
+    def __getitem__(self, i):
+        if i >= len(self): raise IndexError(i)
+
+        pieces = self.batches[i]
+        length = self.bounds[self.buckets[pieces[0]]]
+        mask = np.arange(length) < self.lengths[pieces][:,np.newaxis]
+
+        # Padding frames read the first frame of their take and are zeroed
+        frames = self.starts[pieces][:,np.newaxis] + np.where(mask, np.arange(length), 0)
+        X = self.takes.frames[frames].swapaxes(1, 2)
+        if self.Xmean is not None:
+            X = (X - self.Xmean) / (self.Xstd + 1e-10)
+        X = X * mask[:,np.newaxis]
+
+        return self.transform(X.astype(self.takes.frames.dtype), mask.astype(self.takes.frames.dtype))
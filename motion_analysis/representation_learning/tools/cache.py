@@ -0,0 +1,144 @@
+""" Content-addressed cache of preprocessed clip datasets.
+
+Scripts often call the same loader several times, and every call re-reads,
+decompresses and normalises the dataset again. ``load_cached`` keys the
+normalised clips by a hash of the source file's contents together with the
+preprocessing parameters, keeps them as ``.npy`` files in a local cache
+directory, and memory-maps them back on the next run. Within a process the
+most recently used entries are kept in memory, so repeated calls are free.
+
+A source file with a clip store (see ``tools/clipstore.py``) is read through
+the store, which may have had clips appended since it was converted, so the
+key of such a file also covers the store's manifest, whose shape and version
+change with every append.
+
+The cache directory is ``$MOTION_CACHE_DIR`` if set, ``~/.cache/motion_analysis``
+otherwise. Entries never go stale, since a changed source file or store has a
+new hash; old entries can simply be deleted.
+"""
+
+import hashlib
+import os
+import shutil
+import numpy as np
+
+from collections import OrderedDict
+
+from tools.clipstore import MANIFEST, load_clips, store_path
+from tools.stats import normalisation
+
+cache_dir = os.environ.get('MOTION_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'motion_analysis'))
+
+# Number of datasets kept in memory by ``load_cached``
+lru_size = 4
+
+_hashes = {}
+_lru = OrderedDict()
+
+def file_hash(filename, blocksize=2**20):
+    """ Returns the sha1 of a file, remembered per (path, size, mtime) """
+
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    if key not in _hashes:
+        sha = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                sha.update(block)
+        _hashes[key] = sha.hexdigest()
+    return _hashes[key]
+
+def clip_store(filename):
+    """ Returns the clip store of ``filename``, or ``filename`` if it is one, None if there is none """
+    path = filename if os.path.isdir(filename) else store_path(filename)
+    return path if os.path.isfile(os.path.join(path, MANIFEST)) else None
+
+def source_hash(filename):
+    """
+    Returns the sha1 of a file, combined with the manifest of its clip store
+    if it has one, or of a clip store given directly
+    """
+
+    store = clip_store(filename)
+    if store is None: return file_hash(filename)
+
+    with open(os.path.join(store, MANIFEST), 'rb') as f:
+        manifest = f.read()
+    origin = file_hash(filename) if os.path.isfile(filename) else os.path.abspath(store)
+    return hashlib.sha1(origin.encode('utf-8') + manifest).hexdigest()
+
+def cache_key(filename, **params):
+    """ Returns the cache key of ``filename`` preprocessed with ``params`` """
+    description = source_hash(filename) + repr(sorted(params.items()))
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+def preprocess_clips(filename, channels=(None, -4), footsteps=False, dtype=np.float32):
+    """
+    Loads and normalises clips the way ``load_locomotion`` and friends do.
+
+    :type channels: tuple
+    :param channels: (start, stop) of the normalised channels, e.g. (None, -4)
+    for ``load_locomotion`` or (3, -4) for ``load_terrain``
+
+    :type footsteps: bool
+    :param footsteps: append the four foot contact channels, shifted by -0.5,
+    as ``load_locomotion_w_footsteps`` does
+
+    The clips are read from the clip store of ``filename`` if it has one.
+
+    :returns: (X, Xstd, Xmean)
+    """
+
+    clips, data = load_clips(filename, clip_store(filename) is not None)
+
+    X = np.asarray(clips[:,slice(*channels)]).astype(dtype)
+    Xmean, Xstd = normalisation(X, filename, '%s_%s' % (channels[0] or 0, channels[1]))
+    X = (X - Xmean) / (Xstd + 1e-10)
+
+    if footsteps:
+        C = np.asarray(clips[:,-4:]) - 0.5
+        X = np.concatenate([X, C.astype(dtype)], axis=1)
+
+    return X, Xstd, Xmean
+
+def load_cached(filename, channels=(None, -4), footsteps=False, dtype=np.float32):
+    """
+    Returns ``preprocess_clips(filename, channels, footsteps, dtype)`` in the
+    loaders' format ``([(X,)], Xstd, Xmean)``, from the cache if possible.
+
+    ``X`` is a copy-on-write memory map shared between all callers of this
+    process, so it must not be modified in place.
+    """
+
+    dtype = np.dtype(dtype)
+    key = cache_key(filename, channels=tuple(channels), footsteps=bool(footsteps), dtype=dtype.name)
+
+    if key in _lru:
+        _lru[key] = _lru.pop(key)
+        return _lru[key]
+
+    path = os.path.join(cache_dir, key)
+    if not os.path.isdir(path):
+        X, Xstd, Xmean = preprocess_clips(filename, channels, footsteps, dtype)
+
+        # Populate a private directory first so that concurrent jobs never
+        # see a partially written entry
+        tmp = '%s.tmp%i' % (path, os.getpid())
+        if not os.path.isdir(tmp): os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'X.npy'), X)
+        np.save(os.path.join(tmp, 'Xstd.npy'), Xstd)
+        np.save(os.path.join(tmp, 'Xmean.npy'), Xmean)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp)
+
+    result = ([(np.load(os.path.join(path, 'X.npy'), mmap_mode='c'),)],
+              np.load(os.path.join(path, 'Xstd.npy')),
+              np.load(os.path.join(path, 'Xmean.npy')))
+
+    _lru[key] = result
+    while len(_lru) > lru_size: _lru.popitem(last=False)
+
+    return result
@@ -0,0 +1,412 @@
+""" On-disk clip store that keeps motion clips memory-mapped.
+
+The ``.npz`` files used by the loaders in ``tools/utils.py`` are compressed
+and store clips as (clips, frames, channels). Loading one of them means
+decompressing everything into RAM and then copying it again for every
+``swapaxes``, ``astype`` and normalisation step.
+
+A clip store is a directory holding the clips as a raw float32 buffer already
+laid out as (clips, channels, frames), next to a small ``manifest.json``
+describing its shape. The buffer is opened with ``np.memmap`` so pages are
+only read when touched and are shared between all processes on a host that
+open the same store. Any other array of the source file (e.g. ``classes``)
+is kept as a plain ``.npy`` file inside the store.
+
+``convert_npz`` builds a store from one of the existing ``.npz`` files, and
+``ClipView`` gives a lazily normalised view over the clips, so that loaders
+can hand out data that is only read and normalised batch by batch.
+
+Stores can also be written in a compact format, as float16 or as int16
+quantised with a per-channel offset and scale. A quantised store keeps the
+offset (the channel mean) and the scale next to the clips, and its clips are
+handed out as a ``ClipView`` that dequantises them batch by batch. Because
+dequantising and normalising are both per-channel affine maps, a loader that
+normalises such a view folds the two into a single subtract and divide.
+
+A store also keeps the ``Moments`` of its clips (see ``tools/stats.py``).
+``ClipStore.append`` adds new clips to the end of a store and merges their
+moments into the stored ones, so adding a capture session costs a pass over
+the new clips only. Every append increments the ``version`` recorded in the
+manifest, which tells anything derived from a store whether it is stale.
+"""
+
+import json
+import os
+import numpy as np
+
+from tools.stats import Moments, clip_moments
+
+MANIFEST = 'manifest.json'
+CLIPS = 'clips.bin'
+OFFSET = 'offset.npy'
+SCALE = 'scale.npy'
+MOMENTS = 'moments.npz'
+
+def store_path(filename):
+    """ Returns the default clip store location for an ``.npz`` file """
+    return os.path.splitext(filename)[0] + '.clips'
+
+def convert_npz(filename, path=None, dtype=np.float32, chunksize=256):
+    """
+    Converts an ``.npz`` clip file into a clip store.
+
+    :type filename: string
+    :param filename: path of the ``.npz`` file, containing at least ``clips``
+    with shape (clips, frames, channels)
+
+    :type path: string
+    :param path: directory of the store, ``store_path(filename)`` by default
+
+    :type dtype: numpy.dtype
+    :param dtype: storage type of the clips, float32, float16, or int16 which
+    quantises every channel around its mean with a scale that covers the
+    channel's largest deviation from it
+
+    :type chunksize: int
+    :param chunksize: number of clips transposed and written at once
+
+    :returns: the path of the store
+    """
+
+    if path is None: path = store_path(filename)
+    if not os.path.isdir(path): os.makedirs(path)
+
+    data = np.load(filename)
+    clips = data['clips']
+    n_clips, n_frames, n_channels = clips.shape
+    dtype = np.dtype(dtype)
+
+    quantised = np.issubdtype(dtype, np.integer)
+    if quantised:
+        offset, scale = quantisation(clips, dtype, chunksize)
+        np.save(os.path.join(path, OFFSET), offset)
+        np.save(os.path.join(path, SCALE), scale)
+
+    # Write to a temporary file first so that an interrupted conversion never
+    # leaves a store behind that looks complete
+    moments = Moments(n_channels)
+    tmp = os.path.join(path, CLIPS + '.tmp')
+    with open(tmp, 'wb') as f:
+        for i in range(0, n_clips, chunksize):
+            chunk = clips[i:i+chunksize].swapaxes(1, 2)
+            moments.update(chunk)
+            if quantised: chunk = np.rint((chunk - offset) / scale)
+            f.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+    os.rename(tmp, os.path.join(path, CLIPS))
+    moments.save(os.path.join(path, MOMENTS))
+
+    for key in data.files:
+        if key != 'clips': np.save(os.path.join(path, key + '.npy'), data[key])
+
+    manifest = {
+        'shape': [n_clips, n_channels, n_frames],
+        'dtype': dtype.name,
+        'source': os.path.abspath(filename),
+        'arrays': [key for key in data.files if key != 'clips'],
+        'quantised': quantised,
+        'version': 0,
+    }
+    write_manifest(path, manifest)
+
+    return path
+
+def write_manifest(path, manifest):
+    """ Replaces the manifest of a store in one step """
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp, os.path.join(path, MANIFEST))
+
+def quantisation(clips, dtype=np.int16, chunksize=256):
+    """
+    Returns the per-channel offset and scale, both of shape (1, channels, 1),
+    that map clips of shape (clips, frames, channels) onto the integer
+    ``dtype`` as ``(clips - offset) / scale`` without clipping.
+    """
+
+    n_channels = clips.shape[2]
+    moments = Moments(n_channels)
+    lo = np.full(n_channels, np.inf)
+    hi = np.full(n_channels, -np.inf)
+    for i in range(0, len(clips), chunksize):
+        chunk = clips[i:i+chunksize].swapaxes(1, 2)
+        moments.update(chunk)
+        lo = np.minimum(lo, chunk.min(axis=(0, 2)))
+        hi = np.maximum(hi, chunk.max(axis=(0, 2)))
+
+    offset = moments.mean
+    deviation = np.maximum(hi - offset, offset - lo)
+    scale = deviation / np.iinfo(dtype).max
+    scale[scale == 0] = 1.0
+
+    return offset[np.newaxis,:,np.newaxis], scale[np.newaxis,:,np.newaxis]
+
+class ClipStore(object):
+
+    def __init__(self, path, mode='r'):
+        """
+        Opens a clip store created by ``convert_npz``.
+
+        :type path: string
+        :param path: directory of the store
+
+        :type mode: string
+        :param mode: ``np.memmap`` mode, read-only by default so that the
+        pages can be shared between processes
+        """
+
+        self.path = path
+        self.mode = mode
+
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+
+        self.shape = tuple(self.manifest['shape'])
+        self.dtype = np.dtype(self.manifest['dtype'])
+        self.version = self.manifest.get('version', 0)
+        self.clips = np.memmap(os.path.join(path, CLIPS), dtype=self.dtype,
+                               mode=mode, shape=self.shape)
+
+        self.offset, self.scale = None, None
+        if self.manifest.get('quantised', False):
+            self.offset = np.load(os.path.join(path, OFFSET))
+            self.scale = np.load(os.path.join(path, SCALE))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        """ Returns the clips or one of the other arrays of the source file """
+        if key == 'clips': return self.clips
+        if key not in self.manifest['arrays']: raise KeyError(key)
+        return np.load(os.path.join(self.path, key + '.npy'))
+
+    @property
+    def moments(self):
+        """ The ``Moments`` of all clips, None for stores that do not keep them """
+        filename = os.path.join(self.path, MOMENTS)
+        return Moments.load(filename) if os.path.isfile(filename) else None
+
+    def append(self, clips, chunksize=256, **arrays):
+        """
+        Appends clips to the end of the store and merges their moments into
+        the moments of the store. Only the new clips are read.
+
+        :type clips: numpy.ndarray
+        :param clips: unnormalised clips of shape (clips, channels, frames);
+        a quantised store clips values beyond the range it was built for
+
+        :param arrays: the rows of every other array of the store (e.g.
+        ``classes``) for the new clips
+
+        :returns: the new version of the store
+        """
+
+        if tuple(clips.shape[1:]) != self.shape[1:]:
+            raise ValueError('Clips of shape %s do not fit a store of shape %s'
+                             % (clips.shape, self.shape))
+        missing = set(self.manifest['arrays']) - set(arrays)
+        if missing:
+            raise ValueError('Missing arrays for the new clips: %s' % ', '.join(sorted(missing)))
+
+        moments = self.moments
+        if moments is None: moments = clip_moments(self.view(np.float64), chunksize=chunksize)
+
+        # Anything past the clips listed in the manifest is left over from an
+        # interrupted append and is overwritten
+        size = int(np.prod(self.shape)) * self.dtype.itemsize
+        with open(os.path.join(self.path, CLIPS), 'r+b') as f:
+            f.truncate(size)
+            f.seek(size)
+            for i in range(0, len(clips), chunksize):
+                chunk = np.asarray(clips[i:i+chunksize], dtype=np.float64)
+                moments.update(chunk)
+                if self.offset is not None:
+                    limits = np.iinfo(self.dtype)
+                    chunk = np.clip(np.rint((chunk - self.offset) / self.scale), limits.min, limits.max)
+                f.write(np.ascontiguousarray(chunk, dtype=self.dtype).tobytes())
+
+        for key in self.manifest['arrays']:
+            tmp = os.path.join(self.path, key + '.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, np.concatenate([self[key], arrays[key]]))
+            os.rename(tmp, os.path.join(self.path, key + '.npy'))
+
+        tmp = os.path.join(self.path, 'moments.tmp.npz')
+        moments.save(tmp)
+        os.rename(tmp, os.path.join(self.path, MOMENTS))
+
+        # The manifest goes last, readers only see the new clips once it does
+        self.manifest['shape'][0] += len(clips)
+        self.manifest['version'] = self.version + 1
+        write_manifest(self.path, self.manifest)
+
+        self.shape = tuple(self.manifest['shape'])
+        self.version = self.manifest['version']
+        self.clips = np.memmap(os.path.join(self.path, CLIPS), dtype=self.dtype,
+                               mode=self.mode, shape=self.shape)
+        return self.version
+
+    def view(self, dtype=np.float32):
+        """
+        Returns the clips as ``dtype`` values: the memory map itself, or for
+        a quantised store a ``ClipView`` that dequantises the clips it reads
+        """
+        if self.offset is None: return self.clips
+        return ClipView(self.clips, -self.offset / self.scale, 1.0 / self.scale, dtype=dtype)
+
+def open_store(filename, convert=True):
+    """
+    Opens the clip store of an ``.npz`` file, converting the file first if
+    no store exists yet. ``filename`` may also point at a store directly.
+    """
+
+    path = filename if os.path.isdir(filename) else store_path(filename)
+    if not os.path.isfile(os.path.join(path, MANIFEST)):
+        if not convert: raise IOError('No clip store found at %s' % path)
+        convert_npz(filename, path)
+    return ClipStore(path)
+
+def load_clips(filename, mmap=False):
+    """
+    Returns the clips of a dataset as (clips, channels, frames) together with
+    the loaded file, which gives access to its other arrays (e.g. ``classes``).
+
+    With ``mmap`` the clips are read from the file's clip store (see
+    ``open_store``, created on first use) and are only paged in
+    when touched, otherwise the whole ``.npz`` is decompressed into memory.
+    The clips of a quantised store are returned as a dequantising
+    ``ClipView``.
+
+    Once clips have been appended to the store (see ``ClipStore.append``)
+    the ``.npz`` lacks them, so without ``mmap`` all clips of the store are
+    then read into memory instead, and the store is returned as the file.
+    """
+    if mmap:
+        data = open_store(filename)
+        return data.view(), data
+
+    path = store_path(filename)
+    if os.path.isfile(os.path.join(path, MANIFEST)):
+        store = ClipStore(path)
+        if store.version > 0: return np.array(store.view()), store
+
+    data = np.load(filename)
+    return data['clips'].swapaxes(1, 2), data
+
+class ClipView(object):
+
+    def __init__(self, clips, mean=None, scale=None, index=None, dtype=np.float32):
+        """
+        A lazily normalised view over clips of shape (clips, channels, frames).
+
+        Nothing is read until the view is indexed: selecting rows with a
+        slice, a list or an index array, or channels with a slice as in
+        ``view[:,-3:]``, returns another view, while an integer or
+        ``np.asarray`` returns the normalised data ``(clips - mean) / scale``.
+
+        :type clips: numpy.ndarray or numpy.memmap
+        :param clips: the underlying clips
+
+        :type mean: numpy.ndarray
+        :param mean: per-channel offset of shape (1, channels, 1)
+
+        :type scale: numpy.ndarray
+        :param scale: per-channel divisor of shape (1, channels, 1)
+
+        :type index: numpy.ndarray
+        :param index: clips of ``clips`` this view refers to, all by default
+
+        When ``clips`` is itself a ``ClipView``, e.g. the dequantising view of
+        a quantised store, both views are folded into one, so a batch is
+        still read and mapped in a single pass.
+        """
+
+        if isinstance(clips, ClipView):
+            mean, scale = clips.compose(mean, scale)
+            if clips.index is not None:
+                index = clips.index if index is None else clips.index[index]
+            clips = clips.clips
+
+        self.clips = clips
+        self.mean = mean
+        self.scale = scale
+        self.index = index
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        n = len(self.clips) if self.index is None else len(self.index)
+        return (n,) + tuple(self.clips.shape[1:])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def rows(self, key):
+        """ Maps a row selection on this view to rows of ``clips`` """
+        if self.index is None:
+            return np.arange(len(self.clips))[key]
+        return self.index[key]
+
+    def compose(self, mean, scale):
+        """
+        Returns the mean and scale of normalising this view again with
+        ``mean`` and ``scale``, applied directly to the underlying clips
+        """
+        inner_mean = 0.0 if self.mean is None else self.mean
+        inner_scale = 1.0 if self.scale is None else self.scale
+        if mean is not None: inner_mean = inner_mean + mean * inner_scale
+        if scale is not None: inner_scale = inner_scale * scale
+        if mean is None and self.mean is None: inner_mean = None
+        if scale is None and self.scale is None: inner_scale = None
+        return inner_mean, inner_scale
+
+    def channels(self, key):
+        """ Returns a view of the channels selected by the slice ``key`` """
+        return ClipView(self.clips[:,key],
+            None if self.mean is None else self.mean[:,key],
+            None if self.scale is None else self.scale[:,key],
+            self.index, self.dtype)
+
+    def read(self, rows):
+        """ Reads and normalises the given rows of ``clips`` """
+        if isinstance(rows, slice) or np.isscalar(rows):
+            X = self.clips[rows]
+        else:
+            X = self.clips[np.asarray(rows)]
+        X = X.astype(self.dtype)
+        if self.mean is not None: X -= self.mean[0] if X.ndim == 2 else self.mean
+        if self.scale is not None: X /= self.scale[0] if X.ndim == 2 else self.scale
+        return X
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, rest = key[0], key[1:]
+            if isinstance(rows, (int, np.integer)): return self[rows][rest]
+            if len(rest) == 1 and isinstance(rest[0], slice):
+                return self[rows].channels(rest[0])
+            return np.asarray(self[rows])[(slice(None),) + rest]
+        if isinstance(key, (int, np.integer)):
+            return self.read(self.rows(key))
+        if isinstance(key, slice) and self.index is None:
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return ClipView(self.clips[start:stop], self.mean, self.scale, None, self.dtype)
+        return ClipView(self.clips, self.mean, self.scale, self.rows(key), self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        X = self.read(slice(None) if self.index is None else self.index)
+        return X if dtype is None else X.astype(dtype)
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Converts .npz clip files into clip stores')
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16', 'int16'])
+    args = parser.parse_args()
+    for filename in args.filenames:
+        sys.stdout.write('%s -> %s\n' % (filename, convert_npz(filename, dtype=args.dtype)))
@@ -0,0 +1,108 @@
+""" Foot contact detection.
+
+The ``_w_footsteps`` loaders read four precomputed contact channels, left
+heel, left toe, right heel and right toe, from the end of every clip. This
+module derives them from unnormalised clips instead, for whole batches of
+clips, frames and feet at once:
+
+    speed       the displacement of every foot joint in the world from one
+                frame to the next, from its root-local positions and the
+                root velocity and rotation of the clip
+    height      the y coordinate of every foot joint
+    hysteresis  a foot touches down when its speed and height fall below
+                the ``on`` thresholds and stays down until either rises
+                above the ``off`` thresholds
+
+``detect_contacts`` runs this in chunks, so it can be applied to memory-mapped
+clips of any size.
+"""
+
+import numpy as np
+
+# Heel and toe joints of the left foot, then of the right foot, in the order
+# of the contact channels
+FEET = np.array([3, 4, 7, 8])
+
+def foot_speeds(joints, root_x, root_z, root_r):
+    """
+    Returns the squared world displacement of every joint from each frame to
+    the next, with the last frame repeating the one before.
+
+    :type joints: numpy.ndarray
+    :param joints: root-local positions of shape (clips, joints, 3, frames)
+
+    :type root_x, root_z, root_r: numpy.ndarray
+    :param root_x, root_z, root_r: root velocity and rotational velocity of
+    shape (clips, frames)
+
+    :returns: array of shape (clips, joints, frames)
+    """
+
+    # A joint fixed in the world moves in the root frame of the next frame
+    # by the root velocity and by the rotation of the root
+    c = np.cos(root_r[:,np.newaxis,:-1])
+    s = np.sin(root_r[:,np.newaxis,:-1])
+    x, y, z = joints[:,:,0,:-1], joints[:,:,1,:-1], joints[:,:,2,:-1]
+
+    dx = joints[:,:,0,1:] + root_x[:,np.newaxis,:-1] - (c * x + s * z)
+    dy = joints[:,:,1,1:] - y
+    dz = joints[:,:,2,1:] + root_z[:,np.newaxis,:-1] - (c * z - s * x)
+
+    speeds = dx**2 + dy**2 + dz**2
+    return np.concatenate([speeds, speeds[:,:,-1:]], axis=2)
+
+def hysteresis(on, off, initial=False):
+    """
+    Returns the state of a switch that turns on where ``on`` is true and off
+    where ``off`` is true, and otherwise keeps its state, along the last axis
+    """
+
+    frames = np.arange(on.shape[-1])
+    events = np.where(on | off, frames, -1)
+    last = np.maximum.accumulate(events, axis=-1)
+    state = np.take_along_axis(on, np.maximum(last, 0), axis=-1)
+    return np.where(last >= 0, state, initial)
+
+def foot_contacts(X, offset=0, velocity=(0.05, 0.1), height=((3.0, 2.0), (4.5, 3.0))):
+    """
+    Returns the foot contacts of unnormalised clips.
+
+    :type X: numpy.ndarray
+    :param X: clips of shape (clips, channels, frames) with 21 joint positions
+    starting at channel ``offset``, followed by root_x, root_z and root_r
+
+    :type velocity: tuple
+    :param velocity: (on, off) thresholds on the squared displacement per frame
+
+    :type height: tuple
+    :param height: (on, off) thresholds on the height, each given as
+    (heel, toe)
+
+    :returns: contacts of shape (clips, 4, frames), 1 on the ground and 0 not
+    """
+
+    X = np.asarray(X, dtype=np.float64)
+    joints = X[:,offset:offset+63].reshape((len(X), 21, 3, X.shape[2]))
+    root = offset + 63
+
+    feet = joints[:,FEET]
+    speeds = foot_speeds(feet, X[:,root], X[:,root+1], X[:,root+2])
+    heights = feet[:,:,1]
+
+    on_height = np.tile(height[0], 2)[np.newaxis,:,np.newaxis]
+    off_height = np.tile(height[1], 2)[np.newaxis,:,np.newaxis]
+
+    on = (speeds < velocity[0]) & (heights < on_height)
+    off = (speeds > velocity[1]) | (heights > off_height)
+    return hysteresis(on, off & ~on).astype(np.float32)
+
+def detect_contacts(X, offset=0, chunksize=256, **thresholds):
+    """
+    Runs ``foot_contacts`` over ``X`` in chunks of ``chunksize`` clips, so
+    memory-mapped clips are read only once and never held in memory at once.
+    """
+
+    contacts = np.empty((len(X), len(FEET), X.shape[2]), dtype=np.float32)
+    for i in range(0, len(X), chunksize):
+        contacts[i:i+chunksize] = foot_contacts(X[i:i+chunksize], offset, **thresholds)
+    return contacts
@@ -0,0 +1,122 @@
+""" Representative subsets of clip datasets.
+
+Experiments that only need to compare configurations can train on a small
+subset of the clips, as long as the subset still covers the dataset. A
+coreset is chosen in two steps:
+
+    features    every clip averaged down to a few frames and projected onto
+                its principal components, computed in one chunked pass
+    seeding     k-center (farthest point) or k-means++ seeding on the
+                features, vectorised over all clips per chosen centre
+
+Every chosen clip is weighted by the number of clips closest to it, so the
+weights sum to the size of the dataset.
+"""
+
+import numpy as np
+
+def clip_features(X, n_frames=8, n_components=32, chunksize=1024):
+    """
+    Returns features of shape (clips, n_components) of clips of shape
+    (clips, channels, frames): the clips averaged over ``n_frames`` equal
+    segments and projected onto their first principal components.
+    """
+
+    n_clips, n_channels, frames = X.shape
+    n_frames = min(n_frames, frames)
+    bins = np.arange(frames) * n_frames // frames
+    counts = np.bincount(bins).astype(np.float64)
+
+    def pooled(i):
+        C = np.asarray(X[i:i+chunksize], dtype=np.float64)
+        P = np.zeros(C.shape[:2] + (n_frames,))
+        for b in range(n_frames): P[:,:,b] = C[:,:,bins == b].sum(axis=2) / counts[b]
+        return P.reshape((len(C), -1))
+
+    n_features = n_channels * n_frames
+    total = np.zeros(n_features)
+    scatter = np.zeros((n_features, n_features))
+    for i in range(0, n_clips, chunksize):
+        P = pooled(i)
+        total += P.sum(axis=0)
+        scatter += np.dot(P.T, P)
+
+    mean = total / n_clips
+    covariance = scatter / n_clips - np.outer(mean, mean)
+    values, vectors = np.linalg.eigh(covariance)
+    components = vectors[:,::-1][:,:n_components]
+
+    F = np.empty((n_clips, components.shape[1]), dtype=np.float32)
+    for i in range(0, n_clips, chunksize):
+        F[i:i+chunksize] = np.dot(pooled(i) - mean, components)
+    return F
+
+def k_center(F, k, rng):
+    """
+    Greedy k-center seeding: starting from a random point, repeatedly picks
+    the point farthest from all points picked so far.
+
+    :returns: (centres, nearest) with the index of every centre and the
+    centre closest to every point, as a position in ``centres``
+    """
+    return _seed(F, k, rng, lambda distances: np.argmax(distances))
+
+def k_means_pp(F, k, rng):
+    """
+    k-means++ seeding: picks every next point with a probability
+    proportional to its squared distance from the points picked so far.
+
+    :returns: (centres, nearest) as for ``k_center``
+    """
+    def pick(distances):
+        total = distances.sum()
+        if total == 0: return rng.randint(len(distances))
+        return min(np.searchsorted(np.cumsum(distances), rng.uniform(0, total)), len(distances) - 1)
+    return _seed(F, k, rng, pick)
+
+def _seed(F, k, rng, pick):
+    F = np.asarray(F, dtype=np.float64)
+    k = min(k, len(F))
+
+    centres = np.empty(k, dtype=np.int64)
+    centres[0] = rng.randint(len(F))
+    distances = ((F - F[centres[0]])**2).sum(axis=1)
+    nearest = np.zeros(len(F), dtype=np.int64)
+
+    for c in range(1, k):
+        # Every point is a centre already
+        if distances.max() == 0: return centres[:c], nearest
+        centres[c] = pick(distances)
+        d = ((F - F[centres[c]])**2).sum(axis=1)
+        closer = d < distances
+        distances[closer] = d[closer]
+        nearest[closer] = c
+
+    return centres, nearest
+
+def coreset(X, rng, size, method='k_center', n_frames=8, n_components=32):
+    """
+    Chooses a representative subset of clips.
+
+    :type X: numpy.ndarray, numpy.memmap or ClipView
+    :param X: normalised clips of shape (clips, channels, frames)
+
+    :type size: int or float
+    :param size: number of clips to choose, or a fraction of the dataset
+
+    :type method: string
+    :param method: ``'k_center'`` for the best coverage of outlying motion,
+    ``'k_means_pp'`` for a subset that follows the density of the data
+
+    :returns: (index, weights) with the sorted indices of the chosen clips
+    and the number of clips each one stands for
+    """
+
+    if isinstance(size, float): size = max(1, int(round(size * len(X))))
+    seed = {'k_center': k_center, 'k_means_pp': k_means_pp}[method]
+
+    centres, nearest = seed(clip_features(X, n_frames, n_components), size, rng)
+    weights = np.bincount(nearest, minlength=len(centres)).astype(np.float32)
+
+    order = np.argsort(centres)
+    return centres[order], weights[order]
@@ -0,0 +1,109 @@
+""" Named channel groups over clip tensors.
+
+The normalised clips returned by the loaders have the channel layout
+
+    joints         63 channels, 21 joint positions (x, y, z)
+    root_velocity   2 channels, root velocity along x and z
+    root_rotation   1 channel, root rotational velocity
+    contacts        4 channels, foot contacts (``_w_footsteps`` loaders only)
+
+``root`` (also called ``control``) spans both root groups. ``ClipDataset``
+hands these groups out as strided views, so carving the control signal or
+the joints out of a dataset never copies it, and ``ChannelConcat`` joins
+non-adjacent groups only when a batch is read.
+"""
+
+import numpy as np
+
+def channel_groups(n_channels, contacts=False):
+    """ Returns the channel slice of every group for clips of ``n_channels`` """
+    end = n_channels - 4 if contacts else n_channels
+    groups = {
+        'joints': slice(0, end-3),
+        'root_velocity': slice(end-3, end-1),
+        'root_rotation': slice(end-1, end),
+        'root': slice(end-3, end),
+        'control': slice(end-3, end),
+    }
+    if contacts: groups['contacts'] = slice(end, n_channels)
+    return groups
+
+class ChannelConcat(object):
+
+    def __init__(self, parts):
+        """
+        Concatenation of clip arrays along the channel axis that is only
+        carried out for the clips being read.
+
+        :type parts: list
+        :param parts: arrays (or views) of shape (clips, channels, frames)
+        with the same number of clips and frames
+        """
+
+        self.parts = parts
+        self.dtype = np.result_type(*[p.dtype for p in parts])
+
+    @property
+    def shape(self):
+        s = self.parts[0].shape
+        return (s[0], sum(p.shape[1] for p in self.parts), s[2])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, rest = key[0], key[1:]
+            X = self[rows]
+            return X[rest] if isinstance(rows, (int, np.integer)) else X[(slice(None),) + rest]
+        axis = 0 if isinstance(key, (int, np.integer)) else 1
+        return np.concatenate([np.asarray(p[key], dtype=self.dtype) for p in self.parts], axis=axis)
+
+    def __array__(self, dtype=None, copy=None):
+        X = self[:]
+        return X if dtype is None else X.astype(dtype)
+
+class ClipDataset(object):
+
+    def __init__(self, clips, contacts=False, groups=None):
+        """
+        :type clips: numpy.ndarray, numpy.memmap or ClipView
+        :param clips: normalised clips of shape (clips, channels, frames)
+
+        :type contacts: bool
+        :param contacts: whether the last four channels are foot contacts
+
+        :type groups: dict
+        :param groups: channel slice of every group, ``channel_groups`` by
+        default
+        """
+
+        self.clips = clips
+        self.contacts = contacts
+        self.groups = channel_groups(clips.shape[1], contacts) if groups is None else groups
+
+    def __len__(self):
+        return len(self.clips)
+
+    def __getitem__(self, name):
+        """ Returns a strided view of the channel group ``name`` """
+        return self.clips[:,self.groups[name]]
+
+    def select(self, *names):
+        """
+        Returns the given groups in order along the channel axis, as a view if
+        they are adjacent and as a ``ChannelConcat`` otherwise.
+        """
+
+        slices = [self.groups[name] for name in names]
+        merged = [slices[0]]
+        for s in slices[1:]:
+            if s.start == merged[-1].stop: merged[-1] = slice(merged[-1].start, s.stop)
+            else: merged.append(s)
+
+        if len(merged) == 1: return self.clips[:,merged[0]]
+        return ChannelConcat([self.clips[:,s] for s in merged])
+
+    def subset(self, key):
+        """ Returns a dataset of the clips selected by ``key`` """
+        return ClipDataset(self.clips[key], self.contacts, self.groups)
@@ -0,0 +1,139 @@
+""" Near-duplicate clip detection.
+
+Overlapping windows and repeated takes leave many clips of a dataset nearly
+identical. Deduplication runs in three vectorised steps, each linear in the
+number of clips:
+
+    signatures      the lowest DCT coefficients of every channel, randomly
+                    projected down to a short unit vector per clip
+    hashing         random hyperplane hashes of the signatures, over several
+                    tables; clips sharing a bucket in any table are candidates
+    grouping        every candidate is compared with the first clip of its
+                    bucket only, and matches above the cosine similarity
+                    ``threshold`` are joined into groups
+
+``deduplicate`` returns the clips to keep, one per group, or a weight per
+clip that gives every group the weight of a single clip.
+"""
+
+import numpy as np
+
+def dct_basis(n_frames, n_coefficients):
+    """ Returns the first ``n_coefficients`` orthonormal DCT-II basis vectors as (frames, coefficients) """
+    t = (np.arange(n_frames) + 0.5)[:,np.newaxis]
+    k = np.arange(n_coefficients)[np.newaxis]
+    basis = np.cos(np.pi * t * k / n_frames) * np.sqrt(2.0 / n_frames)
+    basis[:,0] /= np.sqrt(2.0)
+    return basis
+
+def signatures(X, rng, n_coefficients=8, n_dims=64, chunksize=1024):
+    """
+    Returns a unit-length signature of shape (clips, n_dims) for every clip.
+
+    :type X: numpy.ndarray, numpy.memmap or ClipView
+    :param X: normalised clips of shape (clips, channels, frames)
+
+    :type rng: numpy.random.RandomState
+    :param rng: a random number generator for the projection
+
+    :type n_coefficients: int
+    :param n_coefficients: low-frequency DCT coefficients kept per channel
+
+    :type n_dims: int
+    :param n_dims: length of the signatures, None to keep all coefficients
+    """
+
+    n_clips, n_channels, n_frames = X.shape
+    basis = dct_basis(n_frames, n_coefficients)
+
+    n_features = n_channels * n_coefficients
+    projection = None if n_dims is None else rng.normal(size=(n_features, n_dims)) / np.sqrt(n_dims)
+
+    S = np.empty((n_clips, n_features if n_dims is None else n_dims), dtype=np.float32)
+    for i in range(0, n_clips, chunksize):
+        F = np.dot(np.asarray(X[i:i+chunksize], dtype=np.float64), basis).reshape((-1, n_features))
+        S[i:i+chunksize] = F if projection is None else np.dot(F, projection)
+
+    S /= np.maximum(np.sqrt((S**2).sum(axis=1)), 1e-10)[:,np.newaxis]
+    return S
+
+def components(n, a, b):
+    """
+    Returns the connected component of each of ``n`` nodes joined by the
+    edges ``(a[i], b[i])``, labelled by the smallest node in the component
+    """
+
+    labels = np.arange(n)
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        joined = labels.copy()
+        np.minimum.at(joined, a, m)
+        np.minimum.at(joined, b, m)
+        joined = joined[joined]
+        if np.array_equal(joined, labels): return labels
+        labels = joined
+
+def duplicate_groups(S, rng, threshold=0.98, n_tables=8, n_bits=16):
+    """
+    Groups near-duplicate signatures.
+
+    :type S: numpy.ndarray
+    :param S: unit-length signatures as returned by ``signatures``
+
+    :type threshold: float
+    :param threshold: cosine similarity above which two clips are duplicates
+
+    :type n_tables: int
+    :param n_tables: number of hash tables, more tables find more duplicates
+
+    :type n_bits: int
+    :param n_bits: hyperplanes per table, fewer bits give larger buckets
+
+    :returns: the group of every clip, the index of its first clip
+    """
+
+    n = len(S)
+    weights = 2 ** np.arange(n_bits, dtype=np.int64)
+    a, b = [], []
+    for _ in range(n_tables):
+        planes = rng.normal(size=(S.shape[1], n_bits)).astype(S.dtype)
+        keys = np.dot(np.dot(S, planes) > 0, weights)
+
+        # Buckets in random order within, compared with their first clip
+        order = np.lexsort((rng.random_sample(n), keys))
+        keys = keys[order]
+        first = np.concatenate([[True], keys[1:] != keys[:-1]])
+        representative = order[np.maximum.accumulate(np.where(first, np.arange(n), 0))]
+
+        similar = np.einsum('ij,ij->i', S[order], S[representative]) >= threshold
+        similar &= ~first
+        a.append(order[similar])
+        b.append(representative[similar])
+
+    return components(n, np.concatenate(a), np.concatenate(b))
+
+def deduplicate(X, rng, threshold=0.98, weights=False, n_coefficients=8, n_dims=64, n_tables=8, n_bits=16):
+    """
+    Finds near-duplicate clips.
+
+    :type X: numpy.ndarray, numpy.memmap or ClipView
+    :param X: normalised clips of shape (clips, channels, frames)
+
+    :type threshold: float
+    :param threshold: cosine similarity of signatures above which clips are
+    duplicates
+
+    :type weights: bool
+    :param weights: return a weight for every clip, one over the size of its
+    group, instead of dropping duplicates
+
+    :returns: the sorted indices of the clips to keep, the first of every
+    group, or the weights of all clips
+    """
+
+    S = signatures(X, rng, n_coefficients, n_dims)
+    groups = duplicate_groups(S, rng, threshold, n_tables, n_bits)
+
+    if weights:
+        return (1.0 / np.bincount(groups, minlength=len(groups))[groups]).astype(np.float32)
+    return np.where(groups == np.arange(len(groups)))[0]
@@ -0,0 +1,560 @@
+""" Dataset loaders and label utilities.
+
+Everything in this module depends on numpy only, so that worker processes and
+command line tools can load datasets without paying for importing Theano or
+matplotlib. Arrays are returned as ``dtype``, which defaults to Theano's
+``floatX`` when Theano has already been imported and to float32 otherwise.
+
+Labels are either one-hot rows, where a row of zeros marks an unlabelled
+datapoint, or int32 class indices, where ``UNLABELLED`` does. The trainers
+expand class indices to one-hot rows inside the compiled graph, so only
+the indices need to be kept in memory.
+
+The functions are re-exported by ``tools/utils.py``, so existing imports
+from there keep working.
+"""
+
+import pickle
+import gzip
+import numpy as np
+import os
+import sys
+
+from tools.cache import load_cached
+from tools.clipstore import ClipView, load_clips
+from tools.coreset import coreset as choose_coreset
+from tools.stats import normalisation
+
+data_path = '/home/USER_NAME/deep-motion-analysis/gait_classification/data/'
+
+# Class index of unlabelled datapoints
+UNLABELLED = -1
+
+def floatX(dtype=None):
+    """
+    Returns ``dtype``, or if it is None Theano's ``floatX`` when Theano has
+    been imported and float32 otherwise, without importing Theano
+    """
+    if dtype is not None: return dtype
+    theano = sys.modules.get('theano')
+    return theano.config.floatX if theano is not None else 'float32'
+
+def class_indices(labels):
+    """
+    Returns labels as int32 class indices, converting one-hot rows and
+    marking rows of zeros as ``UNLABELLED``
+    """
+    labels = np.asarray(labels)
+    if labels.ndim == 1: return labels.astype(np.int32)
+    classes = np.argmax(labels, axis=1).astype(np.int32)
+    classes[labels[np.arange(len(labels)), classes] != 1] = UNLABELLED
+    return classes
+
+def n_classes(labels):
+    """ Returns the number of classes of one-hot labels or class indices """
+    labels = np.asarray(labels)
+    return labels.shape[1] if labels.ndim == 2 else int(labels.max()) + 1
+
+def clip_normalisation(X, data, filename, key, channels, dtype):
+    """
+    Returns the normalisation of the clips ``X``, the ``channels`` of the
+    clips in ``data``. A clip store keeps the moments of its clips up to date
+    when clips are appended, so they are used directly when ``data`` is one;
+    otherwise the statistics come from ``tools.stats.normalisation``.
+    """
+    moments = getattr(data, 'moments', None)
+    if moments is not None: return moments.channels(channels).normalisation(dtype)
+    return normalisation(X, filename, key, dtype=dtype)
+
+def take_coreset(rng, loaded, coreset=None, method='k_center'):
+    """
+    Returns the ``([(X,)], Xstd, Xmean)`` of a clip loader reduced to a
+    coreset of ``coreset`` clips, or of that fraction of the clips, as
+    ``([(X, weights)], Xstd, Xmean)``, where every weight is the number of
+    clips the clip stands for. Returns ``loaded`` as it is if ``coreset`` is
+    None.
+    """
+    if coreset is None: return loaded
+    [(X,)], Xstd, Xmean = loaded
+    index, weights = choose_coreset(X, rng, coreset, method)
+    return [(X[index], weights)], Xstd, Xmean
+
+def get_labels_to_remove(n_instances, n_to_remove):
+    """
+    Returns an array which indicates the number of labels to remove per class.
+    This ensures that labels are first removed from a the class with the maximum
+    number of labeled instances, and from the class with the lowest index among
+    classes with equally many.
+
+    The counts are water-filled in closed form: the largest classes are
+    lowered to a common level, and what is left over is taken one label each
+    from the first classes at that level.
+    """
+    n_instances = np.asarray(n_instances).astype(np.int64)
+    n_to_remove = int(n_to_remove)
+
+    if (n_to_remove > n_instances.sum()):
+        raise ValueError('Number of labels to remove greater than number of labeled instances')
+
+    to_remove = np.zeros(len(n_instances), dtype=np.int64)
+
+    if (n_to_remove == 0):
+        return to_remove
+
+    # removed[k] labels lower the k+1 largest classes to the next largest count
+    counts = np.sort(n_instances)[::-1]
+    below = np.append(counts[1:], 0)
+    top = np.arange(1, len(counts) + 1)
+    removed = np.cumsum(counts) - top * below
+    k = np.searchsorted(removed, n_to_remove)
+
+    level = -((n_to_remove - np.cumsum(counts)[k]) // top[k])
+    to_remove = np.maximum(n_instances - level, 0)
+
+    at_level = (n_instances >= level) & (level > 0)
+    extra = n_to_remove - to_remove.sum()
+    to_remove += at_level & (np.cumsum(at_level) <= extra)
+
+    return to_remove
+
+def remove_labels(rng, one_hot_labels, n_labels_to_remove, mask=False):
+    """
+    This is used to create an (artifical) semi-supervised learning environment.
+    By convention, unlabeled data is marked as a vector of zeros in lieu of a one-hot-vector,
+    or as ``UNLABELLED`` when ``one_hot_labels`` holds class indices
+
+    :type mask: bool
+    :param mask: return a boolean array marking the datapoints that keep their
+    label instead of removing the labels from ``one_hot_labels`` in place
+    """
+
+    n_datapoints = one_hot_labels.shape[0]
+    labels = class_indices(one_hot_labels)
+
+    if np.any(labels == UNLABELLED):
+        raise ValueError('Received unlabeled instances')
+
+    n_instances_per_class = np.bincount(labels, minlength=n_classes(one_hot_labels))
+    n_to_remove = get_labels_to_remove(n_instances_per_class, n_labels_to_remove)
+
+    # Visit the datapoints in random order grouped by class, the first
+    # n_to_remove of every class lose their label
+    order = rng.permutation(n_datapoints)
+    order = order[np.argsort(labels[order], kind='mergesort')]
+    first = np.cumsum(n_instances_per_class) - n_instances_per_class
+    rank = np.arange(n_datapoints) - first[labels[order]]
+
+    labelled = np.ones(n_datapoints, dtype=bool)
+    labelled[order[rank < n_to_remove[labels[order]]]] = False
+
+    if mask:
+        return labelled
+
+    one_hot_labels[~labelled] = UNLABELLED if one_hot_labels.ndim == 1 else 0
+
+    return one_hot_labels
+
+def take_rows(data, index, lazy=False):
+    """
+    Returns the rows ``index`` of ``data``, as a ``ClipView`` that reads them
+    on access if ``lazy`` and as a copy otherwise.
+    """
+    if lazy and not isinstance(data, ClipView):
+        return ClipView(data, index=index, dtype=data.dtype)
+    return data[index]
+
+def fair_split(rng, data, one_hot_labels, proportions, indices=False, lazy=False):
+    """
+    Splits a dataset in parts given by the percentage in proportions. This split is done
+    in a way that ensures the original balance between classes in every part.
+    This can be important in classificaton, for instance
+
+    ``one_hot_labels`` may also be class indices (see ``class_indices``).
+    With ``indices`` the row indices of every part are returned instead of the
+    data, and with ``lazy`` the data of every part is a view that is only read
+    on access (see ``take_rows``).
+    """
+
+    if (len(proportions) == 1):
+        if indices: return [np.arange(len(data))]
+        return [(data, one_hot_labels)]
+    if (np.sum(proportions) != 1.0):
+        raise ValueError('Proportions must sum up to one.')
+
+    classes = class_indices(one_hot_labels)
+    n_instances_per_class = np.bincount(classes[classes != UNLABELLED], minlength=n_classes(one_hot_labels))
+    n_splits = len(proportions)
+
+    n_instances_per_split = np.array([(p*n_instances_per_class).astype(int) for p in proportions])#.astype(float)
+    # In case of uneven splits
+    n_instances_per_split[0] += n_instances_per_class - np.sum(n_instances_per_split, axis=0)
+
+    n_instances_per_split = np.cumsum(n_instances_per_split, axis=0)
+
+    # Labelled datapoints, grouped by class and in random order within each class
+    labelled = np.where(classes != UNLABELLED)[0]
+    order = labelled[np.lexsort((rng.random_sample(len(labelled)), classes[labelled]))]
+    classes = classes[order]
+
+    # Position of each datapoint within its class decides the split it goes to
+    rank = np.arange(len(order)) - np.searchsorted(classes, np.arange(len(n_instances_per_class)))[classes]
+    split_ids = np.sum(rank[np.newaxis] >= n_instances_per_split[:, classes], axis=0)
+
+    datasets = [rng.permutation(order[split_ids == sid]) for sid in range(n_splits)]
+    if indices: return datasets
+
+    for id, d in enumerate(datasets):
+        datasets[id] = (take_rows(data, d, lazy), one_hot_labels[d])
+
+    return datasets
+
+def random_split(rng, data, one_hot_labels, proportions, indices=False, lazy=False):
+    """
+    Splits a dataset in parts given by the percentage in proportions. This split is done
+    in a way that ensures the original balance between classes in every part.
+    This can be important in classificaton, for instance
+
+    ``indices`` and ``lazy`` work as for ``fair_split``.
+    """
+
+    if (len(proportions) == 1): 
+        if indices: return [np.arange(len(data))]
+        return [(data, one_hot_labels)] 
+    if (np.sum(proportions) != 1.0):
+        raise ValueError('Proportions must sum up to one.')
+
+    n_datapoints = data.shape[0]
+    proportions = np.cumsum(proportions)
+
+    # Random split
+    I = rng.permutation(n_datapoints)
+    split_idx = [0]
+
+    for split in proportions:
+        split_idx.append(int(split * n_datapoints))
+
+    # In case of uneven splits
+    split_idx[0] += n_datapoints - (split_idx[-1])
+
+    datasets = [I[split_idx[sid-1]:split_idx[sid]] for sid in range(1, len(split_idx))]
+    if indices: return datasets
+
+    return [(take_rows(data, d, lazy), one_hot_labels[d]) for d in datasets]
+
+
+def load_hdm05(rng, split=(0.6, 0.2, 0.2), fair=True, filename = data_path + 'hdm05/data_hdm05.npz', mmap=False, dtype=None, one_hot=True):
+    """ Loads HDM05 with one-hot labels, or int32 class indices if not ``one_hot`` """
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    clips, data = load_clips(filename, mmap)
+    classes = data['classes']
+
+
+    # Remove unlabeled data
+    labelled = np.where(classes != -1)[0]
+    Y = classes[labelled]
+
+    print(classes.shape)
+
+    print(classes[:10])
+
+    # Set up labels
+    if one_hot: Y = np.eye(len(np.unique(Y)))[Y]
+
+    # Set up data
+    X = clips[:,:-4]
+    Xmean, Xstd = normalisation(X, filename, 'labelled_0_-4', index=labelled, dtype=dtype)
+
+    if mmap:
+        X = ClipView(X, Xmean, Xstd + 1e-10, labelled, dtype)
+    else:
+        X = X[labelled].astype(dtype)
+        X = (X - Xmean) / (Xstd + 1e-10)
+
+    # Randomise data
+    I = np.arange(len(X))
+    rng.shuffle(I) 
+
+    X = X[I] if mmap else X[I].astype(dtype)
+    Y = Y[I].astype(dtype if one_hot else np.int32)
+
+    # Split data and keep classes balanced
+    datasets = fair_split(rng, X, Y, split)
+
+    return datasets
+
+def load_hdm05_small(rng, split = (0.6, 0.2, 0.2), fair = True, mmap = False, dtype=None, one_hot=True):
+    return load_hdm05(rng = rng, split = split, fair = fair, mmap = mmap, dtype = dtype, one_hot = one_hot,
+                      filename = data_path + 'hdm05/data_hdm05_small.npz')
+
+def load_hdm05_easy(rng, split = (0.6, 0.2, 0.2), fair = True, mmap = False, dtype=None, one_hot=True):
+    return load_hdm05(rng = rng, split = split, fair = fair, mmap = mmap, dtype = dtype, one_hot = one_hot,
+                      filename = data_path + 'hdm05/data_hdm05_easy.npz')
+
+def load_hdm05_easy_small(rng, split = (0.6, 0.2, 0.2), fair = True, mmap = False, dtype=None, one_hot=True):
+    return load_hdm05(rng = rng, split = split, fair = fair, mmap = mmap, dtype = dtype, one_hot = one_hot,
+                      filename = data_path + 'hdm05/data_hdm05_easy_small.npz')
+
+def load_styletransfer(rng, split=(0.6, 0.2, 0.2), labels='combined', mmap=False, dtype=None, one_hot=True):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    clips, data = load_clips(data_path + 'styletransfer/data_styletransfer.npz', mmap)
+    X = clips[:,:-4]
+
+    #(Motion, Styles)
+    classes = data['classes']
+
+    # get mean and std
+    preprocessed = np.load(data_path + '/styletransfer/styletransfer_preprocessed.npz')
+
+    Xmean = preprocessed['Xmean']
+    Xmean = Xmean.reshape(1,len(Xmean),1)
+    Xstd  = preprocessed['Xstd']
+    Xstd = Xstd.reshape(1,len(Xstd),1)
+
+    if mmap:
+        X = ClipView(X, Xmean, Xstd + 1e-10, dtype=dtype)
+    else:
+        X = (X - Xmean) / (Xstd + 1e-10)
+
+    # Motion labels in one-hot vector format
+    Y = np.load(data_path + 'styletransfer/styletransfer_one_hot.npz')[labels]
+    if not one_hot: Y = class_indices(Y)
+
+    # Randomise data
+    I = np.arange(len(X))
+    rng.shuffle(I)
+
+    X = X[I] if mmap else X[I].astype(dtype)
+    Y = Y[I].astype(dtype if one_hot else np.int32)
+
+    datasets = fair_split(rng, X, Y, split)
+    
+    return datasets
+
+def load_cmu(rng, filename='../data/cmu/data_cmu.npz', mmap=False, cache=False, dtype=None, coreset=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    if cache: return take_coreset(rng, load_cached(filename, (None, -4), dtype=dtype), coreset)
+
+    clips, data = load_clips(filename, mmap)
+    X = clips[:,:-4] if mmap else clips[:,:-4].astype(dtype)
+
+    Xmean, Xstd = clip_normalisation(X, data, filename, '0_-4', slice(None, -4), dtype)
+
+    #Xstd[np.where(Xstd == 0)] = 1
+
+    if mmap:
+        X = ClipView(X, Xmean, Xstd + 1e-10, dtype=dtype)
+    else:
+        X = (X - Xmean) / (Xstd + 1e-10)
+
+    # Randomise data
+    #I = np.arange(len(X))
+    #rng.shuffle(I); 
+    #X = X[I]
+    #Xstd = 1.
+    #Xmean = 0.
+
+    return take_coreset(rng, ([(X,)], Xstd, Xmean), coreset)
+
+def load_terrain(rng, filename='../data/data_edin_terrain.npz', mmap=False, cache=False, dtype=None, coreset=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    if cache: return take_coreset(rng, load_cached(filename, (3, -4), dtype=dtype), coreset)
+
+    clips, data = load_clips(filename, mmap)
+    X = clips[:,3:-4] if mmap else clips[:,3:-4].astype(dtype)
+
+    Xmean, Xstd = clip_normalisation(X, data, filename, '3_-4', slice(3, -4), dtype)
+
+    if mmap:
+        X = ClipView(X, Xmean, Xstd + 1e-10, dtype=dtype)
+    else:
+        X = (X - Xmean) / (Xstd + 1e-10)
+
+    return take_coreset(rng, ([(X,)], Xstd, Xmean), coreset)
+
+def load_terrain_w_footsteps(rng, filename='../data/data_edin_terrain.npz', cache=False, dtype=None, coreset=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    if cache: return take_coreset(rng, load_cached(filename, (3, -4), footsteps=True, dtype=dtype), coreset)
+
+    clips, data = load_clips(filename)
+    X = clips[:,:-4].astype(dtype)
+    X = X[:,3:].astype(dtype)
+
+    Xmean, Xstd = normalisation(X, filename, '3_-4', dtype=dtype)
+
+    X = (X - Xmean) / (Xstd + 1e-10)
+    C = clips[:,-4:] - 0.5
+    X = np.concatenate([X, C.astype(dtype)], axis=1)
+
+    return take_coreset(rng, ([(X,)], Xstd, Xmean), coreset)
+
+
+def load_hdm05_generation(rng, filename = data_path + 'hdm05_original/data_hdm05_original.npz', dtype=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    data = np.load(filename)
+
+    clips = data['clips'].swapaxes(1, 2)
+
+    # Remove unlabeled data
+    X = clips[classes != -1]
+
+    # Set up data
+    X = X[:,:-4].astype(dtype)
+
+    Xmean, Xstd = normalisation(X, filename, 'labelled_0_-4', dtype=dtype)
+
+    X = (X - Xmean) / (Xstd + 1e-10)
+
+    # Randomise data
+    I = np.arange(len(X))
+    rng.shuffle(I) 
+
+    X = X[I].astype(dtype)
+
+    return [(X,)], Xstd, Xmean
+
+def load_locomotion(rng, filename='../data/cmu/data_edin_locomotion_processed.npz', mmap=False, cache=False, dtype=None, coreset=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    if cache: return take_coreset(rng, load_cached(filename, (None, -4), dtype=dtype), coreset)
+
+    clips, data = load_clips(filename, mmap)
+    X = clips[:,:-4] if mmap else clips[:,:-4].astype(dtype)
+
+    Xmean, Xstd = clip_normalisation(X, data, filename, '0_-4', slice(None, -4), dtype)
+
+    if mmap:
+        X = ClipView(X, Xmean, Xstd + 1e-10, dtype=dtype)
+    else:
+        X = (X - Xmean) / (Xstd + 1e-10)
+
+    return take_coreset(rng, ([(X,)], Xstd, Xmean), coreset)
+
+def load_locomotion_w_footsteps(rng, filename='../data/cmu/data_edin_locomotion_processed.npz', cache=False, dtype=None, coreset=None):
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    if cache: return take_coreset(rng, load_cached(filename, (None, -4), footsteps=True, dtype=dtype), coreset)
+
+    clips, data = load_clips(filename)
+    X = clips[:,:-4].astype(dtype)
+
+    Xmean, Xstd = normalisation(X, filename, '0_-4', dtype=dtype)
+
+    X = (X - Xmean) / (Xstd + 1e-10)
+    C = clips[:,-4:] - 0.5
+    X = np.concatenate([X, C.astype(dtype)], axis=1)
+
+    return take_coreset(rng, ([(X,)], Xstd, Xmean), coreset)
+
+def load_cmu_small(rng, mmap=False, cache=False, dtype=None, coreset=None):
+    return load_cmu(rng=rng, filename='../data/cmu/data_cmu_small.npz', mmap=mmap, cache=cache, dtype=dtype,
+                    coreset=coreset)
+
+def load_mnist(rng, dtype=None):
+    ''' Loads the MNIST dataset
+
+    :type dataset: string
+    :param dataset: the path to the dataset (here MNIST)
+    '''
+
+    dataset = data_path + 'mnist/mnist.pkl.gz'
+
+    # Download the MNIST dataset if it is not present
+    data_dir, data_file = os.path.split(dataset)
+    if data_dir == "" and not os.path.isfile(dataset):
+        # Check if dataset is in the data directory.
+        new_path = os.path.join(
+            os.path.split(__file__)[0],
+            "..",
+            "data",
+            dataset
+        )
+        if os.path.isfile(new_path) or data_file == 'mnist.pkl.gz':
+            dataset = new_path
+
+    if (not os.path.isfile(dataset)) and data_file == 'mnist.pkl.gz':
+        from six.moves import urllib
+        origin = (
+            'http://www.iro.umontreal.ca/~lisa/deep/data/mnist/mnist.pkl.gz'
+        )
+        sys.stdout.write(('Downloading data from %s\n') % origin)
+        urllib.request.urlretrieve(origin, dataset)
+
+    sys.stdout.write('... loading data\n')
+
+    dtype = floatX(dtype)
+
+    # Load the dataset
+    with gzip.open(dataset, 'rb') as f:
+        try:
+            train_set, valid_set, test_set = pickle.load(f, encoding='latin1')
+        except:
+            train_set, valid_set, test_set = pickle.load(f)
+    # train_set, valid_set, test_set format: tuple(input, target)
+    # input is a np.ndarray of 2 dimensions (a matrix)
+    # where each row corresponds to an example. target is a
+    # np.ndarray of 1 dimension (vector) that has the same length as
+    # the number of rows in the input. It should give the target
+    # to the example with the same index in the input.
+
+    def one_hot_labels(data_xy, borrow=True):
+        """ Function that loads the dataset into shared variables
+
+        The reason we store our dataset in shared variables is to allow
+        Theano to copy it into the GPU memory (when code is run on GPU).
+        Since copying data into the GPU is slow, copying a minibatch everytime
+        is needed (the default behaviour if the data is not in a shared
+        variable) would lead to a large decrease in performance.
+        """
+        data_x, data_y = data_xy
+
+        n_datapoints = data_y.shape[0]
+        # Convert to one_hot_labels
+        # Digits 0-9: 10 classes
+        one_hot_labels = np.zeros([n_datapoints, 10])
+        one_hot_labels[np.arange(n_datapoints), data_y] = 1
+
+        # When storing data on the GPU it has to be stored as floats
+        # therefore we will store the labels as ``floatX`` as well
+        # (``shared_y`` does exactly that). But during our computations
+        # we need them as ints (we use labels as index, and if they are
+        # floats it doesn't make sense) therefore instead of returning
+        # ``shared_y`` we will have to cast it to int. This little hack
+        # lets ous get around this issue
+        return (np.asarray(data_x, dtype=dtype), np.asarray(one_hot_labels, dtype=dtype)) #T.cast(shared_y, 'int32')
+
+    train_set = one_hot_labels(train_set)
+    valid_set = one_hot_labels(valid_set)
+    test_set  = one_hot_labels(test_set)
+
+    datasets = [train_set, valid_set, test_set]
+    return datasets
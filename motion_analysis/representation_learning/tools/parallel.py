@@ -0,0 +1,127 @@
+""" Concurrent loading of several clip datasets into one array.
+
+Loading a dataset is dominated by zlib decompression and numpy
+normalisation, both of which release the GIL. ``load_mixed`` loads a list of
+dataset specs at the same time, on a thread pool or a process pool, and every
+worker writes its normalised clips straight into its own rows of one shared
+output array, so the mixed dataset is never concatenated or copied.
+
+A spec is a dict with the keys
+
+    filename    the ``.npz`` file of the dataset
+    channels    (start, stop) of the normalised channels, (None, -4) by default
+    footsteps   append the foot contacts as the ``_w_footsteps`` loaders do
+    rows        (start, stop) of the clips to keep, all by default
+
+Every dataset is normalised with its own statistics, exactly as the
+loaders in ``tools/utils.py`` do.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+
+from tools.stats import normalisation
+
+DEFAULTS = {'channels': (None, -4), 'footsteps': False, 'rows': (None, None)}
+
+def clips_shape(filename):
+    """ Returns the shape of the ``clips`` of an ``.npz`` without decompressing them """
+    with np.load(filename) as data:
+        f = data.zip.open('clips.npy')
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape = np.lib.format.read_array_header_1_0(f)[0]
+        else:
+            shape = np.lib.format.read_array_header_2_0(f)[0]
+        f.close()
+    return shape
+
+def output_shape(spec):
+    """ Returns the (clips, channels, frames) a spec contributes """
+    n_clips, n_frames, n_channels = clips_shape(spec['filename'])
+    n_rows = len(range(*slice(*spec['rows']).indices(n_clips)))
+    n_channels = len(range(*slice(*spec['channels']).indices(n_channels)))
+    return (n_rows, n_channels + 4 * spec['footsteps'], n_frames)
+
+def _load_into(args):
+    spec, out, start, dtype = args
+
+    if isinstance(out, tuple):
+        path, shape = out
+        out = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    clips = np.load(spec['filename'])['clips'].swapaxes(1, 2)
+    channels = slice(*spec['channels'])
+    X = clips[:,channels].astype(dtype)
+
+    key = '%s_%s' % (spec['channels'][0] or 0, spec['channels'][1])
+    Xmean, Xstd = normalisation(X, spec['filename'], key, dtype=dtype)
+
+    X = X[slice(*spec['rows'])]
+    stop = start + len(X)
+    n_channels = X.shape[1]
+
+    target = out[start:stop,:n_channels]
+    np.subtract(X, Xmean, out=target)
+    np.divide(target, Xstd + 1e-10, out=target)
+
+    if spec['footsteps']:
+        np.subtract(clips[slice(*spec['rows']),-4:], 0.5, out=out[start:stop,n_channels:], casting='unsafe')
+
+    if isinstance(out, np.memmap): out.flush()
+    return Xstd, Xmean
+
+def load_mixed(specs, processes=False, workers=None, dtype=np.float32):
+    """
+    Loads the datasets of ``specs`` concurrently into one array.
+
+    :type specs: list
+    :param specs: dataset specs, see the module documentation
+
+    :type processes: bool
+    :param processes: use worker processes instead of threads, the output is
+    then a memory-mapped temporary file shared with the workers
+
+    :type workers: int
+    :param workers: size of the pool, one worker per spec by default
+
+    :returns: (X, [(Xstd, Xmean), ...]) with the clips of all specs in order
+    """
+
+    specs = [dict(DEFAULTS, **spec) for spec in specs]
+    dtype = np.dtype(dtype)
+
+    shapes = [output_shape(spec) for spec in specs]
+    if len(set(s[1:] for s in shapes)) != 1:
+        raise ValueError('Datasets have different numbers of channels or frames: %s' % shapes)
+
+    starts = np.concatenate([[0], np.cumsum([s[0] for s in shapes])])
+    shape = (int(starts[-1]),) + tuple(shapes[0][1:])
+    workers = workers or len(specs)
+
+    if processes:
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, path = tempfile.mkstemp(suffix='.clips', dir=shm)
+        os.close(fd)
+        out = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        pool = multiprocessing.Pool(workers)
+        target = (path, shape)
+    else:
+        out = np.empty(shape, dtype=dtype)
+        pool = ThreadPool(workers)
+        target = out
+
+    try:
+        stats = pool.map(_load_into, [(spec, target, int(start), dtype)
+                                      for spec, start in zip(specs, starts)])
+    finally:
+        pool.close()
+        pool.join()
+        # The mapping stays valid once the file is gone
+        if processes: os.remove(path)
+
+    return out, stats
@@ -0,0 +1,69 @@
+""" Temporal multi-resolution pyramids of clip datasets.
+
+Level 0 of a pyramid is the dataset itself, and every further level halves
+the frame rate of the one before: frames are low-pass filtered with the
+binomial kernel [1, 4, 6, 4, 1] / 16, with the edge frames repeated, and
+every second frame is kept. Every channel is filtered as a signal, so root
+velocities stay velocities per original frame.
+
+``load_pyramid`` builds the coarse levels of a dataset once, next to its
+entry in the preprocessing cache (see ``tools/cache.py``), and memory-maps
+them back afterwards. ``train_pyramid`` of ``AdamTrainer`` trains on the
+coarse levels first.
+"""
+
+import os
+import shutil
+import numpy as np
+
+from tools import cache
+
+BINOMIAL = np.array([1.0, 4.0, 6.0, 4.0, 1.0]) / 16.0
+
+def downsample(X):
+    """ Returns clips of shape (clips, channels, frames) low-pass filtered and at half the frame rate """
+    r = len(BINOMIAL) // 2
+    X = np.asarray(X)
+    padded = np.concatenate([X[:,:,:1].repeat(r, axis=2), X, X[:,:,-1:].repeat(r, axis=2)], axis=2)
+    frames = X.shape[2]
+    Y = sum(w * padded[:,:,i:i+frames:2] for i, w in enumerate(BINOMIAL))
+    return Y.astype(X.dtype)
+
+def build_pyramid(X, levels=3, chunksize=1024):
+    """ Returns the list of ``levels`` pyramid levels of ``X``, finest first """
+    pyramid = [X]
+    for level in range(1, levels):
+        previous = pyramid[-1]
+        Y = np.empty(previous.shape[:2] + ((previous.shape[2] + 1) // 2,), dtype=previous.dtype)
+        for i in range(0, len(previous), chunksize):
+            Y[i:i+chunksize] = downsample(previous[i:i+chunksize])
+        pyramid.append(Y)
+    return pyramid
+
+def load_pyramid(filename, levels=3, channels=(None, -4), footsteps=False, dtype=np.float32):
+    """
+    Returns the pyramid of a dataset preprocessed as ``tools.cache.load_cached``
+    does, as ``(pyramid, Xstd, Xmean)`` with the levels finest first. All
+    levels are memory-mapped from the cache.
+    """
+
+    dtype = np.dtype(dtype)
+    [(X,)], Xstd, Xmean = cache.load_cached(filename, channels, footsteps, dtype)
+
+    key = cache.cache_key(filename, channels=tuple(channels), footsteps=bool(footsteps),
+                          dtype=dtype.name, pyramid=levels)
+    path = os.path.join(cache.cache_dir, key)
+    names = ['level_%i.npy' % level for level in range(1, levels)]
+
+    if not os.path.isdir(path):
+        tmp = '%s.tmp%i' % (path, os.getpid())
+        if not os.path.isdir(tmp): os.makedirs(tmp)
+        for name, Y in zip(names, build_pyramid(X, levels)[1:]):
+            np.save(os.path.join(tmp, name), Y)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp)
+
+    pyramid = [X] + [np.load(os.path.join(path, name), mmap_mode='c') for name in names]
+    return pyramid, Xstd, Xmean
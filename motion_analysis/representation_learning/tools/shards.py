@@ -0,0 +1,140 @@
+""" Sharded out-of-core clip datasets.
+
+A sharded dataset is a directory of fixed-size ``.npy`` shards of clips laid
+out as (clips, channels, frames), plus a ``manifest.json`` listing the shards
+with their clip counts and a ``moments.npz`` with the dataset's normalisation
+moments (see ``tools/stats.py``), so no reader ever needs the whole corpus in
+memory or a pass over it to normalise.
+
+``ShardReader`` streams minibatches for ``train_batches`` of the trainers:
+shards are visited in random order and clips are shuffled within a bounded
+window of consecutive shards. Shards are opened as read-only memory maps, so
+any number of readers on a host share the same pages of the page cache.
+"""
+
+import json
+import os
+import numpy as np
+
+from tools.stats import Moments
+
+MANIFEST = 'manifest.json'
+MOMENTS = 'moments.npz'
+
+def write_shards(clips, path, shard_size=4096, dtype=np.float32):
+    """
+    Writes clips into a sharded dataset, computing its moments on the way.
+
+    :type clips: numpy.ndarray, numpy.memmap or ClipView
+    :param clips: clips of shape (clips, channels, frames), e.g. the
+    memory-mapped clips of a clip store, read one shard at a time
+
+    :type path: string
+    :param path: directory of the sharded dataset
+
+    :type shard_size: int
+    :param shard_size: number of clips per shard
+    """
+
+    if not os.path.isdir(path): os.makedirs(path)
+
+    moments = Moments(clips.shape[1])
+    shards = []
+    for i in range(0, len(clips), shard_size):
+        X = np.asarray(clips[i:i+shard_size], dtype=dtype)
+        moments.update(X)
+        name = 'shard_%05i.npy' % len(shards)
+        np.save(os.path.join(path, name), X)
+        shards.append({'file': name, 'clips': len(X)})
+
+    moments.save(os.path.join(path, MOMENTS))
+
+    manifest = {
+        'clips': sum(s['clips'] for s in shards),
+        'shape': list(clips.shape[1:]),
+        'dtype': np.dtype(dtype).name,
+        'shards': shards,
+    }
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return path
+
+class ShardReader(object):
+
+    def __init__(self, path, rng, batchsize, window=8192, normalise=True, transform=None):
+        """
+        :type path: string
+        :param path: directory of a dataset written by ``write_shards``
+
+        :type rng: numpy.random.RandomState
+        :param rng: a random number generator used to shuffle shards and clips
+
+        :type batchsize: int
+        :param batchsize: number of clips per batch, clips that do not fill a
+        last batch are dropped every epoch
+
+        :type window: int
+        :param window: number of clips shuffled together, which bounds the
+        memory used by the reader
+
+        :type normalise: bool
+        :param normalise: normalise clips as the loaders in ``tools/utils.py``
+        do, using the moments stored with the dataset
+
+        :type transform: function
+        :param transform: maps a batch of clips to the tuple of arrays given
+        to the training function, whose ``get_cost_updates`` takes them after
+        the networks, e.g. ``(input, output)`` for ``AdamTrainer``. By
+        default ``(X, X)``, the target of an autoencoder.
+        """
+
+        self.path = path
+        self.rng = rng
+        self.batchsize = batchsize
+        self.window = max(window, batchsize)
+        self.transform = (lambda X: (X, X)) if transform is None else transform
+
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+
+        self.moments = Moments.load(os.path.join(path, MOMENTS))
+        self.Xmean, self.Xstd = None, None
+        if normalise:
+            self.Xmean, self.Xstd = self.moments.normalisation(self.manifest['dtype'])
+
+    def __len__(self):
+        return self.manifest['clips'] // self.batchsize
+
+    def shard(self, i):
+        return np.load(os.path.join(self.path, self.manifest['shards'][i]['file']), mmap_mode='r')
+
+    def batches(self, X):
+        """ Shuffles ``X`` and returns its batches and the clips left over """
+        X = X[self.rng.permutation(len(X))]
+        n = (len(X) // self.batchsize) * self.batchsize
+        batches = [X[i:i+self.batchsize] for i in range(0, n, self.batchsize)]
+        return batches, X[n:]
+
+    def __iter__(self):
+
+        pending, n_pending = [], 0
+        for s in self.rng.permutation(len(self.manifest['shards'])):
+            shard = self.shard(s)
+            for i in range(0, len(shard), self.window):
+                pending.append(np.array(shard[i:i+self.window]))
+                n_pending += len(pending[-1])
+                if n_pending < self.window: continue
+
+                batches, rest = self.batches(np.concatenate(pending, axis=0))
+                pending, n_pending = [rest], len(rest)
+                for X in batches: yield self.prepare(X)
+
+        if n_pending >= self.batchsize:
+            batches, rest = self.batches(np.concatenate(pending, axis=0))
+            for X in batches: yield self.prepare(X)
+
+    def prepare(self, X):
+        if self.Xmean is not None:
+            X = (X - self.Xmean) / (self.Xstd + 1e-10)
+        return self.transform(X)
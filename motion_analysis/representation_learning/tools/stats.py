@@ -0,0 +1,193 @@
+""" Streaming normalisation statistics for clip datasets.
+
+All loaders normalise clips of shape (clips, channels, frames) the same way:
+every channel is centred on its mean, except the three root channels at the
+end, and scaled by the standard deviation of the whole dataset, except the
+root velocity (``[-3:-1]``) and root rotation (``[-1:]``) channels which are
+scaled by their own standard deviation.
+
+``Moments`` keeps the count, mean and sum of squared deviations of every
+channel. Chunks are merged in with Chan et al.'s parallel update, so one
+chunked pass over the data (in memory, memory-mapped or sharded) gives all of
+the above statistics, and two ``Moments`` of disjoint data can be merged
+without looking at the data again. All accumulation is done in float64, so
+statistics from ``Moments`` match a float32 reduction over the whole array
+to float32 rounding only, typically within an ulp.
+
+Clips held in memory are normalised with ``exact_normalisation`` instead,
+which reduces them in their own dtype exactly as the loaders always have, so
+the normalisation of existing models is reproduced bit for bit. ``Moments``
+are used where the clips are not in memory: memory-mapped clips, clip
+stores and shards. Either way ``normalisation`` persists the statistics of
+a dataset file next to it, so later runs skip the reduction.
+"""
+
+import os
+import numpy as np
+
+class Moments(object):
+
+    def __init__(self, n_channels):
+        self.count = 0
+        self.mean = np.zeros(n_channels)
+        self.m2 = np.zeros(n_channels)
+
+    @staticmethod
+    def combine(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+        """ Merges the moments of two disjoint partitions of the data """
+        count = count_a + count_b
+        if count == 0: return count, mean_a, m2_a
+        delta = mean_b - mean_a
+        mean = mean_a + delta * (float(count_b) / count)
+        m2 = m2_a + m2_b + delta**2 * (float(count_a) * count_b / count)
+        return count, mean, m2
+
+    def update(self, X):
+        """ Adds a chunk of clips of shape (clips, channels, frames) """
+        if len(X) == 0: return self
+        X = np.asarray(X, dtype=np.float64)
+        count = X.shape[0] * X.shape[2]
+        mean = X.mean(axis=2).mean(axis=0)
+        m2 = ((X - mean[np.newaxis,:,np.newaxis])**2).sum(axis=2).sum(axis=0)
+        self.count, self.mean, self.m2 = self.combine(
+            self.count, self.mean, self.m2, count, mean, m2)
+        return self
+
+    def merge(self, other):
+        """ Adds the moments of another, disjoint part of the dataset """
+        self.count, self.mean, self.m2 = self.combine(
+            self.count, self.mean, self.m2, other.count, other.mean, other.m2)
+        return self
+
+    def pooled(self, channels=slice(None)):
+        """ Returns (mean, std) over all values of the given channels """
+        means, m2s = self.mean[channels], self.m2[channels]
+        mean = means.mean()
+        m2 = m2s.sum() + self.count * ((means - mean)**2).sum()
+        return mean, np.sqrt(m2 / (self.count * len(means)))
+
+    def channels(self, key):
+        """ Returns the moments of the channels selected by ``key`` """
+        moments = Moments(0)
+        moments.count, moments.mean, moments.m2 = self.count, self.mean[key], self.m2[key]
+        return moments
+
+    def std(self):
+        """ Returns the per-channel standard deviation """
+        return np.sqrt(self.m2 / self.count)
+
+    def normalisation(self, dtype=np.float32):
+        """
+        Returns ``(Xmean, Xstd)`` of shape (1, channels, 1) as used by the
+        loaders in ``tools/utils.py``.
+        """
+
+        Xmean = self.mean.copy()
+        Xmean[-3:] = 0.0
+
+        Xstd = np.empty(len(self.mean))
+        Xstd[:] = self.pooled()[1]
+        Xstd[-3:-1] = self.pooled(slice(-3, -1))[1]
+        Xstd[-1:] = self.pooled(slice(-1, None))[1]
+
+        return (Xmean[np.newaxis,:,np.newaxis].astype(dtype),
+                Xstd[np.newaxis,:,np.newaxis].astype(dtype))
+
+    def save(self, filename, **info):
+        np.savez(filename, count=self.count, mean=self.mean, m2=self.m2, **info)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        moments = cls(len(data['mean']))
+        moments.count = int(data['count'])
+        moments.mean = data['mean']
+        moments.m2 = data['m2']
+        return moments
+
+def clip_moments(X, index=None, chunksize=256):
+    """
+    Computes the ``Moments`` of clips in a single chunked pass.
+
+    :type X: numpy.ndarray, numpy.memmap or ClipView
+    :param X: clips of shape (clips, channels, frames)
+
+    :type index: numpy.ndarray
+    :param index: only use these clips of ``X``
+
+    :type chunksize: int
+    :param chunksize: number of clips read at once
+    """
+
+    n = len(X) if index is None else len(index)
+    moments = Moments(X.shape[1])
+    for i in range(0, n, chunksize):
+        moments.update(X[i:i+chunksize] if index is None else X[index[i:i+chunksize]])
+    return moments
+
+def exact_normalisation(X, dtype=np.float32):
+    """
+    Returns the loaders' ``(Xmean, Xstd)`` of clips held in memory, reduced
+    in ``dtype`` in the same order as the original loaders, so the values
+    match those of models trained before the statistics were shared
+    """
+
+    X = np.asarray(X, dtype=dtype)
+
+    Xmean = X.mean(axis=2).mean(axis=0)[np.newaxis,:,np.newaxis]
+    Xmean[:,-3:] = 0.0
+
+    Xstd = np.array([[[X.std()]]]).repeat(X.shape[1], axis=1)
+    Xstd[:,-3:-1] = X[:,-3:-1].std()
+    Xstd[:,-1:  ] = X[:,-1:  ].std()
+
+    return Xmean, Xstd
+
+def stats_path(source, key):
+    """ Returns where the statistics of a selection of ``source`` are kept """
+    return '%s.stats_%s.npz' % (os.path.splitext(source.rstrip(os.sep))[0], key)
+
+def normalisation(X, source=None, key='all', index=None, dtype=None):
+    """
+    Returns the loaders' ``(Xmean, Xstd)`` of ``X``.
+
+    Clips held in memory are reduced exactly with ``exact_normalisation``,
+    other clips with ``clip_moments``. With a ``source`` the result is
+    persisted next to the dataset under ``key`` (which should name the
+    channel and clip selection), the exact statistics per dtype, and reused
+    by later runs, as long as the source file and the selection did not
+    change.
+    """
+
+    dtype = X.dtype if dtype is None else dtype
+    exact = isinstance(X, np.ndarray) and not isinstance(X, np.memmap)
+    if source is None:
+        if exact: return exact_normalisation(X if index is None else X[index], dtype)
+        return clip_moments(X, index).normalisation(dtype)
+
+    n = len(X) if index is None else len(index)
+    filename = stats_path(source, '%s_%s' % (key, np.dtype(dtype).name) if exact else key)
+    signature = np.array([n, X.shape[1], X.shape[2],
+        os.path.getsize(source) if os.path.isfile(source) else 0,
+        int(os.path.getmtime(source)) if os.path.exists(source) else 0])
+
+    if os.path.isfile(filename):
+        stats = np.load(filename)
+        if np.array_equal(stats['signature'], signature):
+            if exact: return stats['Xmean'], stats['Xstd']
+            return Moments.load(filename).normalisation(dtype)
+
+    if exact:
+        Xmean, Xstd = exact_normalisation(X if index is None else X[index], dtype)
+        save = lambda: np.savez(filename, Xmean=Xmean, Xstd=Xstd, signature=signature)
+    else:
+        moments = clip_moments(X, index)
+        Xmean, Xstd = moments.normalisation(dtype)
+        save = lambda: moments.save(filename, signature=signature)
+
+    try:
+        save()
+    except (IOError, OSError):
+        pass
+
+    return Xmean, Xstd
@@ -0,0 +1,157 @@
+""" Sliding windows over continuous takes.
+
+The clip datasets store 240 frame windows cut from each take with a large
+overlap, so every frame is stored several times. ``Takes`` stores every take
+once, as consecutive rows of one (frames, channels) array, and cuts windows
+of any length and hop when they are needed:
+
+    takes.windows(t, window, hop)   all windows of take t as a strided view
+    takes.starts(window, hop)       first frame of every window of every take
+    takes.gather(starts, window)    a batch of windows, (clips, channels, frames)
+
+``WindowDataset`` turns this into a dataset object for ``train_batches`` of
+the trainers, so the window length becomes a training time choice.
+"""
+
+import os
+import numpy as np
+
+from numpy.lib.stride_tricks import as_strided
+
+class Takes(object):
+
+    def __init__(self, frames, offsets):
+        """
+        :type frames: numpy.ndarray or numpy.memmap
+        :param frames: all takes one after the other, shape (frames, channels)
+
+        :type offsets: numpy.ndarray
+        :param offsets: first frame of every take, followed by the number of
+        frames
+        """
+
+        self.frames = frames
+        self.offsets = np.asarray(offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def take(self, t):
+        """ Returns take ``t`` as (channels, frames), a view """
+        return self.frames[self.offsets[t]:self.offsets[t+1]].T
+
+    def windows(self, t, window, hop):
+        """ Returns the windows of take ``t`` as a view of (windows, channels, window) """
+        take = self.frames[self.offsets[t]:self.offsets[t+1]]
+        n = max(0, (len(take) - window) // hop + 1)
+        s_frame, s_channel = take.strides
+        return as_strided(take, shape=(n, take.shape[1], window),
+                          strides=(hop * s_frame, s_channel, s_frame))
+
+    def starts(self, window, hop):
+        """ Returns the first frame in ``frames`` of every window of every take """
+        lengths = np.diff(self.offsets)
+        n = np.maximum(0, (lengths - window) // hop + 1)
+        take = np.repeat(np.arange(len(self)), n)
+        position = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return self.offsets[:-1][take] + position * hop
+
+    def gather(self, starts, window):
+        """ Returns the windows beginning at ``starts`` as (clips, channels, window) """
+        starts = np.asarray(starts)
+        return self.frames[starts[:,np.newaxis] + np.arange(window)].swapaxes(1, 2)
+
+    def save(self, path):
+        if not os.path.isdir(path): os.makedirs(path)
+        np.save(os.path.join(path, 'frames.npy'), self.frames)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        return cls(np.load(os.path.join(path, 'frames.npy'), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, 'offsets.npy')))
+
+    @classmethod
+    def from_list(cls, takes, dtype=np.float32):
+        """ Builds ``Takes`` from a list of (channels, frames) arrays """
+        offsets = np.concatenate([[0], np.cumsum([t.shape[1] for t in takes])])
+        frames = np.concatenate([np.asarray(t, dtype=dtype).T for t in takes], axis=0)
+        return cls(frames, offsets)
+
+    @classmethod
+    def from_clips(cls, clips, hop, atol=1e-5, dtype=np.float32):
+        """
+        Recovers the takes of a dataset of overlapping clips, as (clips,
+        channels, frames), that were cut with the given ``hop``. Consecutive
+        clips belong to the same take when their shared frames are equal.
+        """
+
+        clips = np.asarray(clips)
+        if not 0 < hop < clips.shape[2]:
+            raise ValueError('Hop of %i frames does not overlap clips of %i frames' % (hop, clips.shape[2]))
+
+        same = np.all(np.abs(clips[:-1,:,hop:] - clips[1:,:,:-hop]) <= atol, axis=(1, 2))
+        first = np.concatenate([[True], ~same])
+
+        # Every clip adds its last ``hop`` frames to its take, except the
+        # first clip of a take, which adds all of its frames
+        n_frames = np.where(first, clips.shape[2], hop)
+        offsets = np.concatenate([[0], np.cumsum(n_frames)])
+        frames = np.empty((offsets[-1], clips.shape[1]), dtype=dtype)
+
+        rows = np.repeat(np.arange(len(clips)), n_frames)
+        cols = np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_frames)
+        cols += np.repeat(np.where(first, 0, clips.shape[2] - hop), n_frames)
+        frames[:] = clips[rows, :, cols]
+
+        return cls(frames, offsets[np.concatenate([first, [True]])])
+
+class WindowDataset(object):
+
+    def __init__(self, takes, rng, batchsize, window=240, hop=120, Xmean=None, Xstd=None, transform=None):
+        """
+        A dataset object of shuffled windows for ``train_batches`` of the
+        trainers. Batch ``i`` is gathered from the takes on access, and the
+        windows are reshuffled by calling ``shuffle``.
+
+        :type takes: Takes
+        :param takes: the takes to cut windows from
+
+        :type window: int
+        :param window: window length in frames
+
+        :type hop: int
+        :param hop: frames between the starts of consecutive windows
+
+        :type Xmean, Xstd: numpy.ndarray
+        :param Xmean, Xstd: normalisation as returned by the loaders
+
+        :type transform: function
+        :param transform: maps a batch of windows to the tuple of arrays given
+        to the training function, whose ``get_cost_updates`` takes them after
+        the networks, e.g. ``(input, output)`` for ``AdamTrainer``. By
+        default ``(X, X)``, the target of an autoencoder.
+        """
+
+        self.takes = takes
+        self.rng = rng
+        self.batchsize = batchsize
+        self.window = window
+        self.Xmean = Xmean
+        self.Xstd = Xstd
+        self.transform = (lambda X: (X, X)) if transform is None else transform
+        self.starts = takes.starts(window, hop)
+        self.shuffle()
+
+    def shuffle(self):
+        self.rng.shuffle(self.starts)
+
+    def __len__(self):
+        return len(self.starts) // self.batchsize
+
+    def __getitem__(self, i):
+        if i >= len(self): raise IndexError(i)
+        X = self.takes.gather(self.starts[i*self.batchsize:(i+1)*self.batchsize], self.window)
+        if self.Xmean is not None:
+            X = (X - self.Xmean) / (self.Xstd + 1e-10)
+        return self.transform(X)
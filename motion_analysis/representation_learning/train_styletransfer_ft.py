@@ -39,8 +39,8 @@ Xstd[np.where(Xstd == 0)] = 1
 
 X = (X - Xmean) / Xstd
 
-# Motion labels in one-hot vector format
-Y = np.load('../data/styletransfer_motions_one_hot.npz')['one_hot_vectors']
+# Motion labels as class indices, expanded to one-hot by the trainer
+Y = np.load('../data/styletransfer_classes.npz')['motions']
 
 # Randomise data
 shuffled = zip(X,Y)
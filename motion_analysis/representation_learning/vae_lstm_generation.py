@@ -17,31 +17,25 @@ from nn.AnimateFrames import plot_movement
 
 from tools.utils import load_locomotion
 from tools.utils import load_terrain
+from tools.dataset import ClipDataset
 
 rng = np.random.RandomState(23455)
 
 shared = lambda d: theano.shared(d, borrow=True)
 #dataset, std, mean = load_locomotion(rng)
-dataset, std, mean = load_terrain(rng)
+dataset, std, mean = load_terrain(rng, cache=True)
 
 #print dataset[0][0][1500:1520].shape
 
-#train_control_dataset = dataset[0][0][300:320]
-train_control_dataset = dataset[0][0][1500:1520]
-train_control_dataset = train_control_dataset.swapaxes(0, 1)[-3:]
-train_control_dataset = train_control_dataset.swapaxes(0, 1)
+#dataset = ClipDataset(dataset[0][0][300:320])
+dataset = ClipDataset(dataset[0][0][1500:1520])
+train_control_dataset = dataset['control']
 
 print "control dataset shape = ", train_control_dataset.shape
 
 C = shared(train_control_dataset)
 
-#dataset, std, mean = load_locomotion(rng)
-dataset, std, mean = load_terrain(rng)
-
-#train_motion_input_dataset = dataset[0][0][300:320]
-train_motion_input_dataset = dataset[0][0][1500:1520]
-train_motion_input_dataset = train_motion_input_dataset.swapaxes(0, 1)[:-3]
-train_motion_input_dataset = train_motion_input_dataset.swapaxes(0, 1)
+train_motion_input_dataset = dataset['joints']
 
 print "motion input dataset shape = ", train_motion_input_dataset.shape
 
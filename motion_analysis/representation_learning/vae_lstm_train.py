@@ -14,44 +14,33 @@ from nn.VariationalLayerUnflattened import VariationalLayer
 from nn.LSTM1DHiddenInitLayer import LSTM1DLayer
 from nn.Network import Network, AutoEncodingNetwork, InverseNetwork
 
-from tools.utils import load_locomotion
-from tools.utils import load_terrain
+from tools.dataset import ClipDataset
+from tools.parallel import load_mixed
 
 rng = np.random.RandomState(23455)
 
 shared = lambda d: theano.shared(d, borrow=True)
-dataset1, std1, mean1 = load_locomotion(rng)
-dataset2, std2, mean2 = load_terrain(rng)
+dataset, stats = load_mixed([
+    dict(filename='../data/cmu/data_edin_locomotion_processed.npz', rows=(None, 300)),
+    dict(filename='../data/data_edin_terrain.npz', channels=(3, -4)),
+])
+(std1, mean1), (std2, mean2) = stats
 
-dataset = np.concatenate([dataset1[0][0][:300], dataset2[0][0]], axis=0)
+dataset = ClipDataset(dataset[:1800])
 
-train_control_dataset = dataset[:1800]
-train_control_dataset = train_control_dataset.swapaxes(0, 1)[-3:]
-train_control_dataset = train_control_dataset.swapaxes(0, 1)
+train_control_dataset = dataset['control']
 
 print "control dataset shape = ", train_control_dataset.shape
 
 E = shared(train_control_dataset)
 
-dataset1, std1, mean1 = load_locomotion(rng)
-dataset2, std2, mean2 = load_terrain(rng)
-
-dataset = np.concatenate([dataset1[0][0][:300], dataset2[0][0]], axis=0)
-
-train_motion_input_dataset = dataset[:1800]
-train_motion_input_dataset = train_motion_input_dataset.swapaxes(0, 1)[:-3]
-train_motion_input_dataset = train_motion_input_dataset.swapaxes(0, 1)
+train_motion_input_dataset = dataset['joints']
 
 print "motion input dataset shape = ", train_motion_input_dataset.shape
 
 M_I = shared(train_motion_input_dataset)
 
-dataset1, std1, mean1 = load_locomotion(rng)
-dataset2, std2, mean2 = load_terrain(rng)
-
-dataset = np.concatenate([dataset1[0][0][:300], dataset2[0][0]], axis=0)
-
-train_motion_output_dataset = dataset[:1800]
+train_motion_output_dataset = dataset.clips
 
 print "motion output dataset shape = ", train_motion_output_dataset.shape
 M_O = shared(train_motion_output_dataset)
@@ -147,6 +136,7 @@ trainer.train(network, M_I, E, M_O, filename=[[None, '../models/vae_lstm/3_vae_l
                                         None, None, '../models/vae_lstm/3_vae_lstm_layer_3.npz', None,],
                                         [None, '../models/vae_lstm/3_vae_lstm_layer_4.npz', None, None,
                                         None, '../models/vae_lstm/3_vae_lstm_layer_5.npz', None, None,],
-                                        ['../models/vae_lstm/3_vae_lstm_layer_6.npz',]])
+                                        ['../models/vae_lstm/3_vae_lstm_layer_6.npz',]],
+              state='../models/vae_lstm/3_vae_lstm_state.pkl')
 
 
@@ -14,6 +14,7 @@ from nn.VariationalLayer import VariationalLayer
 from nn.Network import Network, AutoEncodingNetwork, InverseNetwork
 from nn.AdversarialVaeAdamTrainer import AdversarialVaeAdamTrainer
 from nn.ReshapeLayer import ReshapeLayer
+from nn.FunctionCache import cached_function
 
 from nn.AnimationPlotLines import animation_plot
 
@@ -184,7 +185,7 @@ def randomize_uniform_data(n_input):
             high=np.sqrt(3, dtype=theano.config.floatX)).astype(theano.config.floatX)
 
 gen_rand_input = theano.shared(randomize_uniform_data(100), name = 'z')
-generate_sample_motions = theano.function([], generatorNetwork(gen_rand_input))
+generate_sample_motions = cached_function([], generatorNetwork(gen_rand_input))
 sample = generate_sample_motions()
 
 result = sample * (std + 1e-10) + mean
@@ -26,20 +26,11 @@ std  = np.std(clips, axis=(2,0))
 with open('styletransfer_preprocessed.npz', 'w') as sp_f:
     np.savez(sp_f, Xmean=mean, Xstd=std)
 
-## Convert to one-hot representation for classification
-# ['fast_punching', 'fast_walking', 'jumping', 'kicking', 'normal_walking', 'punching', 'running', 'transitions']
-one_hot_motions = np.zeros([nb_datapoints, 8])
-one_hot_motions[np.arange(nb_datapoints), classes[:,0]] = 1
-
-# ['angry', 'childlike', 'depressed', 'neutral', 'old', 'proud', 'sexy', 'strutting']
-one_hot_styles  = np.zeros([nb_datapoints, 8])
-one_hot_styles[np.arange(nb_datapoints), classes[:,1]] = 1
-
-with open('styletransfer_motions_one_hot.npz', 'w') as smo_f:
-    np.savez(smo_f, one_hot_vectors=one_hot_motions)
-
-with open('styletransfer_styles_one_hot.npz', 'w') as sso_f:
-    np.savez(sso_f, one_hot_vectors=one_hot_styles)
+## Class indices for classification, expanded to one-hot inside the training graph
+# Motions: ['fast_punching', 'fast_walking', 'jumping', 'kicking', 'normal_walking', 'punching', 'running', 'transitions']
+# Styles:  ['angry', 'childlike', 'depressed', 'neutral', 'old', 'proud', 'sexy', 'strutting']
+with open('styletransfer_classes.npz', 'w') as sc_f:
+    np.savez(sc_f, motions=classes[:,0].astype(np.int32), styles=classes[:,1].astype(np.int32))
 
 # Convert to Weka's arff format
 #with open('motion_classifcation.arff', 'w') as mc_f: